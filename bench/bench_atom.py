@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Compare the Atom parsing TheProvince used to do by hand (four namespaced
+# xpath queries per entry) with the single pass of AtomBase.
+#
+#   python bench/bench_atom.py [feed.atom]
+#
+# Without a feed argument a feed like those of The Province is generated.
+# Both take the parsed document, the download and parse being the same.
+
+import os
+import sys
+import timeit
+import tracemalloc
+from lxml import etree
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from sources.canada import TheProvince  # noqa: E402
+
+
+def sample_feed():
+    entries = "".join(
+        '<entry Status="{1}"><id>{0}</id><title type="html">Metro Vancouver story {0}'
+        "</title><updated>2020-05-01T10:00:00Z</updated>"
+        '<link type="text/html" href="/news/story{0}.html" '
+        'Abstract="Council approved new transit and housing measures on Tuesday."/>'
+        "<author><name>The Province</name></author></entry>".format(
+            i, "PAID" if i % 10 == 0 else "FREE"
+        )
+        for i in range(1000)
+    )
+    feed = (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<feed xmlns="http://www.w3.org/2005/Atom"><title>The Province</title>'
+        + entries
+        + "</feed>"
+    )
+    return feed.encode("utf-8")
+
+
+def hand_parsed(doc):
+    # the code TheProvince had before AtomBase
+    resultList = []
+    for entry in doc.xpath(
+        '//ns:entry[@Status="FREE"]',
+        namespaces={"ns": "http://www.w3.org/2005/Atom"},
+    ):
+        title = entry.xpath(
+            'ns:title[@type="html"]',
+            namespaces={"ns": "http://www.w3.org/2005/Atom"},
+        )[0].text
+        link = "http://www.theprovince.com" + entry.xpath(
+            'ns:link[@type="text/html"]',
+            namespaces={"ns": "http://www.w3.org/2005/Atom"},
+        )[0].get("href")
+        abstract = entry.xpath(
+            'ns:link[@type="text/html"]',
+            namespaces={"ns": "http://www.w3.org/2005/Atom"},
+        )[0].get("Abstract")
+        resultList.append({"title": title.strip(), "url": link, "abstract": abstract})
+    return resultList
+
+
+def atom_base(doc):
+    return list(TheProvince()._extract_articles(doc))
+
+
+def measure(fn, doc, number=20):
+    seconds = min(timeit.repeat(lambda: fn(doc), number=number, repeat=5)) / number
+    tracemalloc.start()
+    articles = fn(doc)
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak, articles
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            data = f.read()
+    else:
+        data = sample_feed()
+
+    doc = etree.fromstring(data)
+    print("feed size: {:,} bytes".format(len(data)))
+    results = []
+    for fn in (hand_parsed, atom_base):
+        (seconds, peak, articles) = measure(fn, doc)
+        results.append(articles)
+        print(
+            "{:<12} {:8.2f} ms  python peak {:>10,} bytes  {} articles".format(
+                fn.__name__, seconds * 1000, peak, len(articles)
+            )
+        )
+    if results[0] != results[1]:
+        sys.exit("the two disagree")
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Compare decoding a big5-hkscs page in python before parsing (the old MingPao
+# code path) with fetcher.read_html_page, which streams the bytes into lxml.
+# The page is served from a replay fixture (see replay.py), so every case goes
+# through the same download code and only the decoding and parsing differ:
+#
+#   decode_then_parse  read_http_page, decode in python, document_fromstring
+#   read_html_page     the charset given, as the MingPao sources do
+#   read_html_sniffed  the charset read from the page's <meta> tag
+#
+#   python bench/bench_encoding.py [page.htm]
+#
+# Without a page argument a MingPao-like section page is generated.
+
+import os
+import sys
+import shutil
+import tempfile
+import timeit
+import tracemalloc
+from lxml import html
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import replay  # noqa: E402
+from fetcher import read_http_page, read_html_page  # noqa: E402
+
+ENCODING = "big5-hkscs"
+XPATH = '//h4[contains(@class, "listing-link")]/a'
+URL = "https://news.mingpao.com/bench/section.htm"
+
+
+def sample_page():
+    items = "".join(
+        '<div class="listing"><h4 class="listing-link"><a href="a{0}.htm">'
+        "加國新聞第{0}則 溫哥華社區活動報道</a></h4>"
+        "<p>明報記者報道，市議會今日通過多項議案，涉及交通及房屋政策。</p></div>".format(i)
+        for i in range(1500)
+    )
+    page = (
+        '<html><head><meta http-equiv="Content-Type" content="text/html; charset=big5">'
+        "<title>明報加西版</title></head><body>" + items + "</body></html>"
+    )
+    return page.encode(ENCODING)
+
+
+def decode_then_parse():
+    data = read_http_page(URL).decode(ENCODING, errors="ignore")
+    return len(html.document_fromstring(data).xpath(XPATH))
+
+
+def read_html():
+    return len(read_html_page(URL, encoding=ENCODING).xpath(XPATH))
+
+
+def read_html_sniffed():
+    return len(read_html_page(URL).xpath(XPATH))
+
+
+def measure(fn, number=20):
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    tracemalloc.start()
+    count = fn()
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak, count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            data = f.read()
+    else:
+        data = sample_page()
+
+    directory = tempfile.mkdtemp()
+    try:
+        replay.configure("replay", directory)
+        # no charset in the header, as MingPao serves it
+        replay.save(replay.SHARED, URL, None, 200, {"Content-Type": "text/html"}, data)
+
+        print("page size: {:,} bytes".format(len(data)))
+        for (name, fn) in (
+            ("decode_then_parse", decode_then_parse),
+            ("read_html_page", read_html),
+            ("read_html_sniffed", read_html_sniffed),
+        ):
+            (seconds, peak, count) = measure(fn)
+            print(
+                "{:<18} {:8.2f} ms  python peak {:>10,} bytes  {} links".format(
+                    name, seconds * 1000, peak, count
+                )
+            )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
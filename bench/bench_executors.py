@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Compare the executors of executors.py refreshing sources on their fixtures
+# (see replay.py) all at once, as pipeline.refresh_many does.
+#
+#   python bench/bench_executors.py [SOURCE ...] [--modes thread,process,asyncio]
+#       [--runs N] [--latency S] [--workers N] [--fixtures DIR] [--output FILE]
+#
+# Every mode first refreshes the sources once untimed (the process executor
+# starts its workers then), then --runs times. The median wall time, the CPU
+# time of this process and the articles found are reported, and the results
+# of every mode are checked to be the same.
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import replay  # noqa: E402
+import executors  # noqa: E402
+import pipeline  # noqa: E402
+
+
+def digest(results):
+    return hashlib.sha1(
+        json.dumps(results, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:12]
+
+
+def bench_mode(executor, sources, runs):
+    pipeline.refresh_many(sources, executor)
+    walls = []
+    cpus = []
+    for _ in range(runs):
+        (wall, cpu) = (time.perf_counter(), time.process_time())
+        results = pipeline.refresh_many(sources, executor)
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    return {
+        "wall": statistics.median(walls),
+        "cpu": statistics.median(cpus),
+        "articles": sum(1 for r in results for a in r if a.get("url")),
+        "digest": digest(results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark executors on fixtures")
+    parser.add_argument("sources", nargs="*", help="source ids, default all recorded")
+    parser.add_argument("--modes", default=",".join(executors.EXECUTORS))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0, help="seconds per page")
+    parser.add_argument("--workers", type=int, help="processes of the process mode")
+    parser.add_argument("--fixtures", default=replay.FIXTURES_DIR)
+    parser.add_argument("--output", help="save the results (json) here")
+    args = parser.parse_args()
+
+    replay.configure("replay", args.fixtures, args.latency)
+    if args.workers:
+        executors.PROCESS_WORKERS = args.workers
+
+    from util import get_sources
+
+    allSources = get_sources()
+    ids = args.sources or [id for id in replay.sources() if id in allSources]
+    if not ids:
+        sys.exit("no fixtures in {}, see replay.py".format(args.fixtures))
+    sources = [allSources[id] for id in ids]
+
+    print("{} sources: {}".format(len(ids), " ".join(ids)))
+    print(
+        "{:8} {:>10} {:>10} {:>9} {:>13}".format(
+            "mode", "wall ms", "cpu ms", "articles", "digest"
+        )
+    )
+    results = {}
+    for mode in args.modes.split(","):
+        executor = executors.EXECUTORS[mode]()
+        try:
+            r = bench_mode(executor, sources, args.runs)
+        finally:
+            if hasattr(executor, "shutdown"):
+                executor.shutdown()
+        results[mode] = r
+        print(
+            "{:8} {:10.2f} {:10.2f} {:9} {:>13}".format(
+                mode, r["wall"] * 1000, r["cpu"] * 1000, r["articles"], r["digest"]
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if len({r["digest"] for r in results.values()}) > 1:
+        sys.exit("the modes returned different articles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Compare the json backends of jsoncodec with what was used before: decoding
+# the body to str for json.loads, and encoding responses as jsonify does
+# (sorted keys, non-ASCII \u escaped).
+#
+#   python bench/bench_json.py [--fixtures DIR]
+#
+# Decoding runs on the json bodies recorded by replay.py (LibertyTimes, the
+# AppleDaily sites), encoding on the articles of the recorded sources. Without
+# fixtures, data like theirs is generated.
+
+import os
+import sys
+import json
+import glob
+import timeit
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import replay  # noqa: E402
+import jsoncodec  # noqa: E402
+from context import source_scope  # noqa: E402
+
+
+def sample_response():
+    # a Fusion content query
+    elements = [
+        {
+            "headlines": {"basic": "港聞第{}則 立法會今日通過多項議案".format(i)},
+            "website_url": "/local/20200501/{}/".format(i),
+            "content_elements": [{"type": "text", "content": "記者報道，議案涉及交通及房屋政策。" * 5}]
+            * 3,
+            "taxonomy": {"sections": [{"_id": "/local", "name": "港聞"}]},
+        }
+        for i in range(300)
+    ]
+    return json.dumps({"content_elements": elements}, ensure_ascii=False).encode(
+        "utf-8"
+    )
+
+
+def sample_articles():
+    articles = []
+    for s in range(10):
+        articles.append({"title": "要聞{}".format(s)})
+        articles.extend(
+            {
+                "title": "加國新聞第{}則 溫哥華社區活動報道".format(i),
+                "url": "https://example.com/news/{}/{}".format(s, i),
+                "abstract": "市議會今日通過多項議案，涉及交通及房屋政策。" * 3,
+            }
+            for i in range(50)
+        )
+    return articles
+
+
+def recorded_responses(directory):
+    responses = []
+    for path in glob.glob(os.path.join(directory, "*", "*.body")):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data.lstrip()[:1] in (b"{", b"["):
+            try:
+                json.loads(data)
+                responses.append(data)
+            except ValueError:
+                pass
+    return responses
+
+
+def recorded_articles(directory):
+    replay.configure("replay", directory)
+    import main as app_main
+
+    articles = []
+    for id in replay.sources():
+        if id in app_main.allSources:
+            source = app_main.allSources[id]
+            with source_scope(source):
+                articles.extend(source.get_articles())
+    return articles
+
+
+def jsonify_encode(obj):
+    # flask 1.x jsonify without pretty printing
+    return json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def str_decode(data):
+    return json.loads(data.decode("utf-8"))
+
+
+def timed(fn, items, number=10):
+    return (
+        min(timeit.repeat(lambda: [fn(i) for i in items], number=number, repeat=5))
+        / number
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark json backends")
+    parser.add_argument("--fixtures", default=replay.FIXTURES_DIR)
+    args = parser.parse_args()
+
+    responses = recorded_responses(args.fixtures) or [sample_response()]
+    articles = recorded_articles(args.fixtures) or sample_articles()
+    print(
+        "decode: {} responses, {:,} bytes".format(
+            len(responses), sum(len(r) for r in responses)
+        )
+    )
+    print("{:<16} {:>9}".format("", "ms"))
+    print("{:<16} {:9.2f}".format("before", timed(str_decode, responses) * 1000))
+    for (name, (loads, _)) in jsoncodec.BACKENDS.items():
+        print("{:<16} {:9.2f}".format(name, timed(loads, responses) * 1000))
+
+    print()
+    print("encode: {} articles".format(len(articles)))
+    print("{:<16} {:>9} {:>12}".format("", "ms", "bytes"))
+    print(
+        "{:<16} {:9.2f} {:12,}".format(
+            "before (jsonify)",
+            timed(jsonify_encode, [articles]) * 1000,
+            len(jsonify_encode(articles)),
+        )
+    )
+    for (name, (_, dumps)) in jsoncodec.BACKENDS.items():
+        print(
+            "{:<16} {:9.2f} {:12,}".format(
+                name, timed(dumps, [articles]) * 1000, len(dumps(articles))
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
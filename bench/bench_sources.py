@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# End-to-end scraping benchmark on recorded pages (see replay.py).
+#
+#   python bench/bench_sources.py [SOURCE ...] [--runs N] [--requests N]
+#       [--fixtures DIR] [--output FILE] [--compare BASELINE] [--tolerance F]
+#
+# For every source, get_articles is run on its fixtures and the median wall
+# time, CPU time, peak python memory and articles per second are reported.
+# Then /list and /<source> are requested through the Flask app to measure
+# request throughput. --output saves the results as json, to be used as the
+# baseline of a later run with --compare, which exits with status 1 when a
+# timing got worse by more than --tolerance (default 25%).
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import replay  # noqa: E402
+from context import source_scope  # noqa: E402
+
+# results compared against the baseline; larger is worse for all of them
+TIMINGS = ("wall", "cpu")
+
+
+def bench_source(source, runs):
+    walls = []
+    cpus = []
+    count = 0
+    with source_scope(source):
+        for _ in range(runs):
+            (wall, cpu) = (time.perf_counter(), time.process_time())
+            articles = source.get_articles()
+            walls.append(time.perf_counter() - wall)
+            cpus.append(time.process_time() - cpu)
+            count = sum(1 for a in articles if a.get("url"))
+
+        # separate run, tracemalloc slows everything down. Memory held by
+        # lxml itself isn't seen by it
+        tracemalloc.start()
+        source.get_articles()
+        (_, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    wall = statistics.median(walls)
+    return {
+        "wall": wall,
+        "cpu": statistics.median(cpus),
+        "peak_memory": peak,
+        "articles": count,
+        "articles_per_second": count / wall if wall else 0,
+    }
+
+
+def bench_requests(client, path, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(path)
+        if response.status_code != 200:
+            return None
+    elapsed = time.perf_counter() - start
+    return {"wall": elapsed / requests, "requests_per_second": requests / elapsed}
+
+
+def compare(results, baseline, tolerance):
+    # returns the lines describing regressions
+    regressions = []
+    for section in ("sources", "requests"):
+        for (name, now) in results[section].items():
+            before = baseline.get(section, {}).get(name)
+            if not before or not now:
+                continue
+            for key in TIMINGS:
+                if (
+                    key in now
+                    and before.get(key)
+                    and now[key] > before[key] * (1 + tolerance)
+                ):
+                    regressions.append(
+                        "{} {}: {} {:.2f} ms -> {:.2f} ms".format(
+                            section, name, key, before[key] * 1000, now[key] * 1000
+                        )
+                    )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark sources on fixtures")
+    parser.add_argument("sources", nargs="*", help="source ids, default all recorded")
+    parser.add_argument("--runs", type=int, default=5, help="get_articles runs")
+    parser.add_argument("--requests", type=int, default=20, help="requests per route")
+    parser.add_argument("--fixtures", default=replay.FIXTURES_DIR)
+    parser.add_argument("--output", help="save the results (json) here")
+    parser.add_argument("--compare", help="baseline json to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    replay.configure("replay", args.fixtures)
+
+    import main as app_main
+
+    allSources = app_main.allSources
+    ids = args.sources or [
+        id for id in allSources if os.path.isdir(os.path.join(args.fixtures, id))
+    ]
+    if not ids:
+        sys.exit("no fixtures in {}, see replay.py".format(args.fixtures))
+
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "sources": {},
+        "requests": {},
+    }
+
+    print(
+        "{:24} {:>10} {:>10} {:>12} {:>9} {:>11}".format(
+            "source", "wall ms", "cpu ms", "peak bytes", "articles", "articles/s"
+        )
+    )
+    for id in ids:
+        r = bench_source(allSources[id], args.runs)
+        results["sources"][id] = r
+        print(
+            "{:24} {:10.2f} {:10.2f} {:12,} {:9} {:11.0f}".format(
+                id,
+                r["wall"] * 1000,
+                r["cpu"] * 1000,
+                r["peak_memory"],
+                r["articles"],
+                r["articles_per_second"],
+            )
+        )
+
+    print()
+    print("{:24} {:>10} {:>10}".format("route", "wall ms", "req/s"))
+    client = app_main.app.test_client()
+    for path in ["/list"] + ["/" + id for id in ids]:
+        r = bench_requests(client, path, args.requests)
+        results["requests"][path] = r
+        if r:
+            print(
+                "{:24} {:10.2f} {:10.1f}".format(
+                    path, r["wall"] * 1000, r["requests_per_second"]
+                )
+            )
+        else:
+            print("{:24} failed".format(path))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        print()
+        for line in regressions:
+            print("REGRESSION " + line)
+        if regressions:
+            sys.exit(1)
+        print("no regression against " + args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Load test of the app against a stand-in for the news sites.
+#
+#   python bench/loadtest.py [--clients 10,100,300] [--cache off,on]
+#       [--workers 8] [--requests N] [--latency S] [--jitter S]
+#       [--error-rate F] [--throttle N] [--fixtures DIR] [--output FILE]
+#   python bench/loadtest.py --serve PORT [--latency S] ...
+#
+# The stand-in upstream serves the pages recorded by replay.py, after
+# --latency (+ up to --jitter) seconds. A --error-rate fraction of requests
+# fail with 503, and more than --throttle requests in flight to one host get
+# 429. The app runs in a threaded werkzeug server with its fetcher pointed at
+# the stand-in (fetcher.UPSTREAM), and a pool of clients requests /list and
+# the sources with fixtures in turn.
+#
+# Every combination of --clients, --cache (clients share a cache honouring
+# Cache-Control, like a proxy in front of the app) and --workers (threads per
+# source refresh, context.MAX_WORKERS) is run; for each the p50 / p95 / p99
+# latency, throughput, errors and upstream requests are reported.
+#
+# With --serve only the stand-in is started, e.g. to load a deployed app
+# started with NEWSSUM_UPSTREAM=http://<host>:PORT.
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import unquote, urlparse
+
+import urllib3
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import replay  # noqa: E402
+
+_max_age = re.compile(r"max-age=(\d+)")
+
+
+class Upstream:
+    def __init__(self, latency=0, jitter=0, error_rate=0, throttle=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle = throttle
+        self._lock = threading.Lock()
+        self._in_flight = Counter()
+        self.reset()
+
+    def reset(self):
+        # returns the counts since the last reset
+        with self._lock:
+            stats = getattr(self, "stats", None)
+            self.stats = Counter()
+        return stats
+
+    def _count(self, *keys):
+        with self._lock:
+            for key in keys:
+                self.stats[key] += 1
+
+    def handle(self, url, cookie_header):
+        # returns (status, headers, body)
+        host = urlparse(url).netloc
+        self._count("requests", "host " + host)
+        with self._lock:
+            if self.throttle and self._in_flight[host] >= self.throttle:
+                self.stats["throttled"] += 1
+                return 429, {}, b"throttled"
+            self._in_flight[host] += 1
+        try:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+            if random.random() < self.error_rate:
+                self._count("errors")
+                return 503, {}, b"unavailable"
+
+            cookies = dict(
+                c.strip().split("=", 1) for c in cookie_header.split(";") if "=" in c
+            )
+            for source in replay.sources():
+                r = replay.load(url, cookies, source)
+                if r is not None:
+                    return r.status, r.headers, b"".join(r.stream(1 << 20))
+            self._count("missing")
+            return 404, {}, b"not recorded"
+        finally:
+            with self._lock:
+                self._in_flight[host] -= 1
+
+    def serve(self, port=0):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                (status, headers, body) = upstream.handle(
+                    unquote(self.path[1:]), self.headers.get("Cookie", "")
+                )
+                self.send_response(status)
+                for (name, value) in headers.items():
+                    if name.lower() not in (
+                        "content-length",
+                        "transfer-encoding",
+                        "content-encoding",
+                        "connection",
+                    ):
+                        self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[int(round(p / 100.0 * (len(values) - 1)))]
+
+
+def run_load(base_url, paths, clients, requests, cache):
+    http = urllib3.PoolManager(maxsize=clients, timeout=120)
+    lock = threading.Lock()
+    state = {"next": 0, "hits": 0, "errors": 0}
+    latencies = []
+    cached = {}
+
+    def client():
+        while True:
+            with lock:
+                n = state["next"]
+                if n >= requests:
+                    return
+                state["next"] += 1
+                path = paths[n % len(paths)]
+                if cache and cached.get(path, 0) > time.monotonic():
+                    state["hits"] += 1
+                    continue
+
+            start = time.perf_counter()
+            try:
+                r = http.request("GET", base_url + path, retries=False)
+                ok = r.status == 200
+            except (Exception, Warning):
+                ok = False
+            elapsed = time.perf_counter() - start
+
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    state["errors"] += 1
+                elif cache:
+                    m = _max_age.search(r.headers.get("Cache-Control", ""))
+                    if m and "no-cache" not in r.headers.get("Cache-Control", ""):
+                        cached[path] = time.monotonic() + int(m.group(1))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "cache_hits": state["hits"],
+        "errors": state["errors"],
+        "throughput": requests / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def _list(value, convert):
+    return [convert(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="load test against a stand-in upstream"
+    )
+    parser.add_argument("--clients", default="10,100", help="comma separated")
+    parser.add_argument("--cache", default="off,on", help="comma separated off / on")
+    parser.add_argument("--workers", default="8", help="comma separated")
+    parser.add_argument("--requests", type=int, default=500, help="per configuration")
+    parser.add_argument("--latency", type=float, default=0.2, help="upstream seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="upstream seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle", type=int, default=0, help="requests per host")
+    parser.add_argument("--fixtures", default=replay.FIXTURES_DIR)
+    parser.add_argument("--output", help="save the results (json) here")
+    parser.add_argument("--serve", type=int, help="only run the stand-in on this port")
+    args = parser.parse_args()
+
+    replay.configure(None, args.fixtures)
+    upstream = Upstream(args.latency, args.jitter, args.error_rate, args.throttle)
+    server = upstream.serve(args.serve or 0)
+    upstream_url = "http://127.0.0.1:{}".format(server.server_port)
+    if args.serve:
+        print("stand-in upstream at " + upstream_url)
+        threading.Event().wait()
+
+    import fetcher
+    import context
+
+    fetcher.UPSTREAM = upstream_url
+    import main as app_main
+    from werkzeug.serving import make_server
+
+    app = make_server("127.0.0.1", 0, app_main.app, threaded=True)
+    threading.Thread(target=app.serve_forever, daemon=True).start()
+    base_url = "http://127.0.0.1:{}".format(app.server_port)
+
+    paths = ["/list"] + [
+        "/" + id for id in replay.sources() if id in app_main.allSources
+    ]
+    if len(paths) == 1:
+        sys.exit("no fixtures in {}, see replay.py".format(args.fixtures))
+
+    print(
+        "{:>7} {:>5} {:>7} {:>6} {:>6} {:>8} {:>8} {:>8} {:>8} {:>9} {:>9}".format(
+            "clients",
+            "cache",
+            "workers",
+            "hits",
+            "errors",
+            "req/s",
+            "p50 ms",
+            "p95 ms",
+            "p99 ms",
+            "upstream",
+            "throttled",
+        )
+    )
+    results = []
+    for clients in _list(args.clients, int):
+        for cache in _list(args.cache, lambda v: v == "on"):
+            for workers in _list(args.workers, int):
+                context.MAX_WORKERS = workers
+                upstream.reset()
+                r = run_load(base_url, paths, clients, args.requests, cache)
+                stats = upstream.reset()
+                r.update(
+                    clients=clients,
+                    cache=cache,
+                    workers=workers,
+                    upstream=dict(stats),
+                )
+                results.append(r)
+                print(
+                    "{:7} {:>5} {:7} {:6} {:6} {:8.1f} {:8.1f} {:8.1f} {:8.1f} {:9} {:9}".format(
+                        clients,
+                        "on" if cache else "off",
+                        workers,
+                        r["cache_hits"],
+                        r["errors"],
+                        r["throughput"],
+                        r["p50"] * 1000,
+                        r["p95"] * 1000,
+                        r["p99"] * 1000,
+                        stats["requests"],
+                        stats["throttled"],
+                    )
+                )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# In-process cache for values that are expensive to get from upstream but
+# change rarely (deployment ids, edition dates, feed lists). Hits and misses
+# are counted in the newssum_cache_requests_total metric under the cache name.
+
+import time
+import threading
+
+import metrics
+
+
+class TTLCache:
+    def __init__(self, name, ttl, maxsize=256):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        # key -> (expiry, value)
+        self._entries = {}
+        # key -> lock held while the value is being computed
+        self._pending = {}
+
+    def _lookup(self, key):
+        # callers hold _lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key)
+        metrics.record_cache(self.name, entry is not None)
+        return entry[1] if entry is not None else default
+
+    def set(self, key, value, ttl=None):
+        expiry = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.maxsize:
+                # drop the entry closest to expiring
+                del self._entries[min(self._entries, key=lambda k: self._entries[k][0])]
+            self._entries[key] = (expiry, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_or_set(self, key, compute, ttl=None):
+        # cached value of key, or compute() stored for next time. Concurrent
+        # callers missing the same key wait for one compute instead of all
+        # going upstream. None results are not cached
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                pending = self._pending.setdefault(key, threading.Lock())
+        if entry is not None:
+            metrics.record_cache(self.name, True)
+            return entry[1]
+
+        with pending:
+            with self._lock:
+                entry = self._lookup(key)
+            if entry is not None:
+                metrics.record_cache(self.name, True)
+                return entry[1]
+            metrics.record_cache(self.name, False)
+            try:
+                value = compute()
+                if value is not None:
+                    self.set(key, value, ttl)
+                return value
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Group near-identical headlines from different sources with MinHash + LSH.
+# Each headline is broken into character n-grams (CJK headlines have no word
+# boundaries), hashed into a MinHash signature, and the signature is cut into
+# bands. Headlines sharing any band land in the same bucket and become
+# candidates; candidates whose estimated similarity passes SIMILARITY are merged.
+
+import random
+import threading
+import zlib
+
+from dedup import normalize_title
+
+SHINGLE_SIZE = 2
+NUM_PERM = 64
+BANDS = 16
+SIMILARITY = 0.5
+
+_PRIME = (1 << 61) - 1
+_rnd = random.Random(20201206)
+_PERMS = [
+    (_rnd.randrange(1, _PRIME), _rnd.randrange(0, _PRIME)) for _ in range(NUM_PERM)
+]
+_ROWS = NUM_PERM // BANDS
+
+
+def shingles(title, size=SHINGLE_SIZE):
+    text = normalize_title(title)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {
+        text[start:end]
+        for (start, end) in zip(range(len(text)), range(size, len(text) + 1))
+    }
+
+
+def minhash(title):
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles(title)]
+    if not hashes:
+        return None
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for (a, b) in _PERMS)
+
+
+def similarity(sig1, sig2):
+    return sum(1 for (x, y) in zip(sig1, sig2) if x == y) / float(NUM_PERM)
+
+
+class HeadlineClusterer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # source id -> list of (article, signature)
+        self._entries = {}
+        # normalised title -> signature, so unchanged headlines aren't rehashed
+        self._signatures = {}
+
+    def update(self, source_id, articles):
+        articles = [a for a in articles if a.get("url") and a.get("title")]
+        keys = [normalize_title(a["title"]) for a in articles]
+        with self._lock:
+            known = {k: self._signatures[k] for k in keys if k in self._signatures}
+        # hashed outside the lock, sources refreshed together update at once
+        for (article, key) in zip(articles, keys):
+            if key not in known:
+                known[key] = minhash(article["title"])
+        entries = [
+            (article, known[key])
+            for (article, key) in zip(articles, keys)
+            if known[key]
+        ]
+
+        with self._lock:
+            self._entries[source_id] = entries
+            self._signatures.update(known)
+            # forget signatures of headlines no longer held by any source
+            if len(self._signatures) > 4 * sum(len(e) for e in self._entries.values()):
+                live = {
+                    normalize_title(a["title"])
+                    for e in self._entries.values()
+                    for (a, _) in e
+                }
+                self._signatures = {
+                    k: v for (k, v) in self._signatures.items() if k in live
+                }
+
+    def clusters(self, min_sources=2):
+        with self._lock:
+            items = [
+                (source_id, article, sig)
+                for (source_id, entries) in self._entries.items()
+                for (article, sig) in entries
+            ]
+
+        parent = list(range(len(items)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        buckets = {}
+        for (i, (_, _, sig)) in enumerate(items):
+            for (band, start) in enumerate(range(0, NUM_PERM, _ROWS)):
+                end = start + _ROWS
+                key = (band,) + sig[start:end]
+                j = buckets.setdefault(key, i)
+                if j != i:
+                    (ri, rj) = (find(i), find(j))
+                    if ri != rj and similarity(sig, items[j][2]) >= SIMILARITY:
+                        parent[ri] = rj
+
+        groups = {}
+        for i in range(len(items)):
+            groups.setdefault(find(i), []).append(items[i])
+
+        result = []
+        for group in groups.values():
+            sources = {source_id for (source_id, _, _) in group}
+            if len(sources) >= min_sources:
+                result.append(
+                    [(source_id, article) for (source_id, article, _) in group]
+                )
+
+        # stories picked up by the most outlets first
+        result.sort(key=lambda g: (len({s for (s, _) in g}), len(g)), reverse=True)
+        return result
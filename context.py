@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# State that follows the refresh of a source through the code it calls, so
+# that shared code (e.g. the fetcher) can tell which source it is working for.
+
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# upper bound on threads used by run_concurrently
+MAX_WORKERS = 8
+
+current_source = contextvars.ContextVar("current_source", default=None)
+# title of the section the source is working on, set by section_scope
+current_section = contextvars.ContextVar("current_section", default=None)
+# profiler.Sampler of the request, if it is being profiled
+current_sampler = contextvars.ContextVar("current_sampler", default=None)
+
+
+@contextmanager
+def source_scope(source):
+    token = current_source.set(source)
+    section_token = current_section.set(None)
+    try:
+        yield source
+    finally:
+        current_section.reset(section_token)
+        current_source.reset(token)
+
+
+@contextmanager
+def section_scope(title):
+    # what runs inside is attributed to this section in logs and metrics
+    token = current_section.set(title)
+    try:
+        yield title
+    finally:
+        current_section.reset(token)
+
+
+def source_id():
+    source = current_source.get()
+    return source.get_id() if source is not None else None
+
+
+@contextmanager
+def worker_scope():
+    # the calling thread works for the request of its context for a while;
+    # a profiler sampling that request samples the thread meanwhile
+    sampler = current_sampler.get()
+    if sampler is None:
+        yield
+        return
+    ident = threading.get_ident()
+    sampler.add_thread(ident)
+    try:
+        yield
+    finally:
+        sampler.remove_thread(ident)
+
+
+def _run_in_worker(func, item):
+    with worker_scope():
+        return func(item)
+
+
+def run_concurrently(func, items, max_workers=None):
+    # call func on each item in a thread pool and return the results in the
+    # order of items. Each call runs in a copy of the caller's context, so the
+    # source, section, trace and profiler follow the work into the threads
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    workers = min(max_workers or MAX_WORKERS, len(items))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, _run_in_worker, func, item)
+            for item in items
+        ]
+        return [f.result() for f in futures]
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import re
+import unicodedata
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+# query parameters that only track where the click came from
+TRACKING_PARAMS = {"fbclid", "gclid"}
+
+# titles shorter than this (after normalisation) are too generic to match on
+MIN_FINGERPRINT_LENGTH = 4
+
+_non_word = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_url(url):
+    if not url:
+        return None
+    try:
+        parts = urlparse(url.strip())
+    except ValueError:
+        return None
+
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/")
+    query = sorted(
+        (key, value)
+        for (key, value) in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.startswith("utm_") and key not in TRACKING_PARAMS
+    )
+    # scheme and fragment are ignored: http/https and anchors point to the same story
+    return host + path + ("?" + urlencode(query) if query else "")
+
+
+def normalize_title(title):
+    # NFKC folds full-width forms commonly found in CJK headlines
+    return _non_word.sub("", unicodedata.normalize("NFKC", title or "").lower())
+
+
+def title_fingerprint(title):
+    fingerprint = normalize_title(title)
+    return fingerprint if len(fingerprint) >= MIN_FINGERPRINT_LENGTH else None
+
+
+class DedupIndex:
+    def __init__(self, by_url=True, by_title=True):
+        self._by_url = by_url
+        self._by_title = by_title
+        self._urls = {}
+        self._titles = {}
+        self._count = 0
+
+    def _keys(self, article):
+        url_key = normalize_url(article.get("url")) if self._by_url else None
+        title_key = title_fingerprint(article.get("title")) if self._by_title else None
+        return url_key, title_key
+
+    def find(self, article):
+        # return the first article indexed with the same url or title, if any
+        url_key, title_key = self._keys(article)
+        if url_key and url_key in self._urls:
+            return self._urls[url_key]
+        if title_key and title_key in self._titles:
+            return self._titles[title_key]
+        return None
+
+    def add(self, article):
+        # index the article. returns False if it duplicates one already seen
+        url_key, title_key = self._keys(article)
+        if (url_key and url_key in self._urls) or (
+            title_key and title_key in self._titles
+        ):
+            return False
+        if url_key:
+            self._urls[url_key] = article
+        if title_key:
+            self._titles[title_key] = article
+        self._count += 1
+        return True
+
+    def __contains__(self, article):
+        return self.find(article) is not None
+
+    def __len__(self):
+        return self._count
+
+
+def merge_feeds(feeds):
+    # combine (desc, articles) pairs into one list, keeping the first copy of
+    # each story and dropping sections that end up empty
+    index = DedupIndex()
+    resultList = []
+    for (desc, articles) in feeds:
+        resultList.append({"title": desc})
+        section = None
+        for article in articles:
+            if not article.get("url"):
+                section = article
+            elif index.add(article):
+                if section is not None:
+                    resultList.append(section)
+                    section = None
+                resultList.append(article)
+
+    return resultList
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# How the get_articles of sources are run when several sources are refreshed
+# at once (pipeline.refresh_many), chosen with NEWSSUM_EXECUTOR:
+#
+#   thread   threads of this process (the default)
+#   process  a pool of worker processes, for when the extraction of big pages
+#            keeps the CPU busy. Workers return the articles encoded with
+#            jsoncodec, which is cheaper to send back than pickled dicts.
+#            Their logs go to their own stderr and their metrics and spans
+#            stay in the worker. So do their caches (pagination snapshots,
+#            deployment ids, edition dates, feed lists): a source only
+#            benefits from them when it lands on the same worker again
+#   asyncio  an event loop handing the sources to its default executor; the
+#            fetcher is blocking, so this is threads scheduled by asyncio
+#
+# Executors take a list of sources and return, in order, an (articles,
+# seconds) pair for each: its article list and how long its get_articles
+# took. A source whose get_articles raises is logged and gets an empty list,
+# in every mode.
+#
+# A single source (pipeline.refresh, e.g. /<source>) is always refreshed in
+# this process with LOCAL, next to the caches, whatever NEWSSUM_EXECUTOR says.
+
+import os
+import time
+import asyncio
+import contextvars
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from logger import logger
+from context import source_scope, worker_scope, run_concurrently
+import jsoncodec
+import replay
+import fetcher
+
+# worker processes of the process executor
+PROCESS_WORKERS = os.cpu_count() or 2
+
+
+def _get_articles(source):
+    # the same in every mode: a source that fails gets no articles, and
+    # doesn't fail the others refreshed with it
+    start = time.perf_counter()
+    with source_scope(source):
+        try:
+            articles = source.get_articles()
+        except Exception as e:
+            logger.exception("Problem getting articles of " + source.get_id(), e)
+            articles = []
+    return (articles, time.perf_counter() - start)
+
+
+class ThreadExecutor:
+    name = "thread"
+
+    def get_articles(self, sources):
+        return run_concurrently(_get_articles, sources)
+
+
+def _get_articles_in_worker(source):
+    with worker_scope():
+        return _get_articles(source)
+
+
+class AsyncioExecutor:
+    name = "asyncio"
+
+    def get_articles(self, sources):
+        async def gather():
+            loop = asyncio.get_running_loop()
+            return await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        None,
+                        contextvars.copy_context().run,
+                        _get_articles_in_worker,
+                        source,
+                    )
+                    for source in sources
+                )
+            )
+
+        return list(asyncio.run(gather()))
+
+
+# set in each worker process
+_worker_sources = None
+
+
+def _init_worker(replay_settings, upstream):
+    global _worker_sources
+    from util import get_sources
+
+    replay.configure(*replay_settings)
+    fetcher.UPSTREAM = upstream
+    _worker_sources = get_sources()
+
+
+def _worker_get_articles(id):
+    (articles, seconds) = _get_articles(_worker_sources[id])
+    return (jsoncodec.dumps(articles), seconds)
+
+
+class ProcessExecutor:
+    name = "process"
+
+    def __init__(self, workers=None):
+        self.workers = workers or PROCESS_WORKERS
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawned rather than forked, this process has threads running
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(replay.settings(), fetcher.UPSTREAM),
+                )
+            return self._pool
+
+    def _discard_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def get_articles(self, sources):
+        pool = self._get_pool()
+        futures = [
+            (source, pool.submit(_worker_get_articles, source.get_id()))
+            for source in sources
+        ]
+        results = []
+        for (source, future) in futures:
+            try:
+                (encoded, seconds) = future.result()
+                results.append((jsoncodec.loads(encoded), seconds))
+            except BrokenProcessPool as e:
+                # a worker died; a new pool is started next time
+                self._discard_pool(pool)
+                logger.exception("Worker process failed for " + source.get_id(), e)
+                results.append(([], 0.0))
+            except Exception as e:
+                # the worker handled errors of the source itself, so this is
+                # the result not coming back (e.g. too large to send)
+                logger.exception("Problem getting articles of " + source.get_id(), e)
+                results.append(([], 0.0))
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            pool = self._pool
+            self._pool = None
+        if pool is not None:
+            pool.shutdown()
+
+
+# for single sources, see above
+LOCAL = ThreadExecutor()
+
+EXECUTORS = {
+    "thread": ThreadExecutor,
+    "process": ProcessExecutor,
+    "asyncio": AsyncioExecutor,
+}
+
+_current = {}
+
+
+def use(name):
+    previous = _current.get("executor")
+    if previous is not None and hasattr(previous, "shutdown"):
+        previous.shutdown()
+    _current["executor"] = EXECUTORS[name]()
+
+
+def current():
+    return _current["executor"]
+
+
+use(os.environ.get("NEWSSUM_EXECUTOR") or "thread")
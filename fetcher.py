@@ -18,13 +18,79 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
+import re
+import time
+import threading
+from urllib.parse import quote, urlparse
 import urllib3
+from lxml import etree
+from lxml import html
+
+from logger import logger
+from context import current_source
+import metrics
+import tracing
+import replay
 
 URL_TIMEOUT = 15
 
+# send every request to this server instead, with the original url quoted as
+# the path, e.g. the stand-in upstream of bench/loadtest.py
+UPSTREAM = os.environ.get("NEWSSUM_UPSTREAM")
+
+# downloads from one host at the same time; more wait for their turn
+MAX_CONNECTIONS_PER_HOST = 4
+# hosts, and idle connections per host, kept in the connection pool. More
+# than MAX_CONNECTIONS_PER_HOST for when NEWSSUM_UPSTREAM sends every
+# host's requests to the same place
+POOL_HOSTS = 64
+POOL_CONNECTIONS = 16
+
+# bodies larger than this are abandoned as soon as the limit is crossed.
+# Sources can change it with their max_page_size attribute
+MAX_PAGE_SIZE = 8 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# charsets that pages commonly declare when they actually use a superset
+CHARSET_ALIASES = {
+    "big5": "big5-hkscs",
+    "gb2312": "gb18030",
+    "gbk": "gb18030",
+}
+# how far into the body to look for a <meta> charset declaration
+CHARSET_SNIFF_SIZE = 2048
+# pages in these (legacy multi-byte) charsets often hold byte sequences that
+# libxml2 rejects; their bytes are kept while parsing, for the fallback in
+# read_html_page
+FALLBACK_CHARSETS = ("big5", "gb", "shift_jis", "euc", "cp9")
+
+_header_charset = re.compile(r"charset\s*=\s*[\"']?([\w\-]+)", re.IGNORECASE)
+_meta_charset = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?([\w\-]+)", re.IGNORECASE)
+
+
+# one pool for all sources, so that connections to a host are kept alive from
+# one page to the next (the sections of a site, the editions of a family)
+_pool = urllib3.PoolManager(
+    num_pools=POOL_HOSTS, maxsize=POOL_CONNECTIONS, timeout=URL_TIMEOUT
+)
+
+_host_lock = threading.Lock()
+_host_slots = {}
+
+
+def _host_slot(url):
+    host = urlparse(url).netloc
+    with _host_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(MAX_CONNECTIONS_PER_HOST)
+        return _host_slots[host]
+
+
+def _http_get(url, cookies=None):
+    if replay.mode() == "replay":
+        return replay.load(url, cookies)
 
-def read_http_page(url, cookies=None):
-    http = urllib3.PoolManager(timeout=URL_TIMEOUT)
     headers = {
         "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:74.0) Gecko/20100101 Firefox/74.0"
     }
@@ -33,10 +99,232 @@ def read_http_page(url, cookies=None):
             ["%s=%s" % (key, value) for (key, value) in cookies.items()]
         )
 
+    target = UPSTREAM + "/" + quote(url, safe="") if UPSTREAM else url
     try:
-        r = http.request("GET", url, headers=headers)
-        return r.data
+        r = _pool.request("GET", target, headers=headers, preload_content=False)
     except (Exception, Warning):
-        pass
+        return None
+
+    if replay.mode() == "record":
+        return replay.RecordingResponse(r, url, cookies)
+    return r
+
+
+def _page_size_limit(max_size):
+    if max_size:
+        return max_size
+    return getattr(current_source.get(), "max_page_size", None) or MAX_PAGE_SIZE
+
+
+def _download(url, cookies=None, max_size=None, consumer=None):
+    # stream the body in chunks, handing each one to consumer as it arrives.
+    # Chunks are only kept when there is no consumer, or when the consumer
+    # returns False for them (it wants the bytes kept). Returns (headers,
+    # kept chunks, body size), or None if the page couldn't be fetched or grew
+    # beyond the size limit
+    with tracing.span("fetch", url=url) as span, _host_slot(url):
+        result = _stream(url, cookies, max_size, consumer)
+        span.set(ok=result is not None)
+        return result
+
+
+def _stream(url, cookies, max_size, consumer):
+    start = time.perf_counter()
+    size = 0
+    chunks = []
+    complete = False
+    r = _http_get(url, cookies)
+    if r is None:
+        metrics.record_fetch(time.perf_counter() - start, size, False)
+        return None
+
+    limit = _page_size_limit(max_size)
+    try:
+        length = r.headers.get("Content-Length")
+        if r.status >= 400:
+            logger.warning("HTTP status {}".format(r.status), url=url)
+            # read the (error) body, so the connection can be reused
+            r.drain_conn()
+        elif length and length.isdigit() and int(length) > limit:
+            logger.warning(
+                "Skipped page of {} bytes, over limit {}".format(length, limit), url=url
+            )
+            r.close()
+        else:
+            for chunk in r.stream(CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    logger.warning(
+                        "Aborted page over limit {}".format(limit),
+                        url=url,
+                        duration=time.perf_counter() - start,
+                    )
+                    r.close()
+                    break
+                if consumer is None or consumer(r.headers, chunk) is False:
+                    chunks.append(chunk)
+            else:
+                complete = True
+                r.drain_conn()
+    except (Exception, Warning):
+        complete = False
+        r.close()
+    finally:
+        # a closed connection goes back to the pool too, to be reopened
+        r.release_conn()
+        if complete:
+            metrics.record_page_size(url, size)
+        metrics.record_fetch(time.perf_counter() - start, size, complete)
 
-    return None
+    return (r.headers, chunks, size) if complete else None
+
+
+def read_http_page(url, cookies=None, max_size=None):
+    result = _download(url, cookies, max_size)
+    return b"".join(result[1]) if result else None
+
+
+def get_charset(headers, data):
+    # the Content-Type header wins over a <meta> tag, as in browsers
+    m = _header_charset.search(headers.get("Content-Type", ""))
+    if m:
+        charset = m.group(1)
+    else:
+        m = _meta_charset.search(data[:CHARSET_SNIFF_SIZE])
+        if not m:
+            return None
+        charset = m.group(1).decode("ascii")
+
+    charset = charset.lower()
+    return CHARSET_ALIASES.get(charset, charset)
+
+
+class _HtmlFeeder:
+    # incremental html parser. The encoding is settled on the first chunk,
+    # after which every chunk goes straight into libxml2
+    def __init__(self, encoding=None):
+        self.encoding = encoding
+        self.parser = None
+        self.failed = False
+        self.keep = False
+        self.parse_time = 0
+
+    def __call__(self, headers, chunk):
+        start = time.perf_counter()
+        if self.parser is None:
+            self.encoding = self.encoding or get_charset(headers, chunk)
+            try:
+                self.parser = html.HTMLParser(encoding=self.encoding)
+            except LookupError:
+                # unknown to libxml2, let it detect the encoding itself
+                self.encoding = None
+                self.parser = html.HTMLParser()
+            self.keep = bool(self.encoding) and self.encoding.lower().startswith(
+                FALLBACK_CHARSETS
+            )
+        if not self.failed:
+            try:
+                self.parser.feed(chunk)
+            except etree.XMLSyntaxError:
+                self.failed = True
+        self.parse_time += time.perf_counter() - start
+        # False asks the fetcher to keep the chunk
+        return not self.keep
+
+    def close(self):
+        start = time.perf_counter()
+        doc = None
+        if not self.failed:
+            try:
+                doc = self.parser.close()
+            except etree.XMLSyntaxError:
+                self.failed = True
+        self.parse_time += time.perf_counter() - start
+        if self.failed or any(
+            e.type == etree.ErrorTypes.ERR_INVALID_ENCODING
+            or e.domain == etree.ErrorDomains.I18N
+            for e in self.parser.error_log
+        ):
+            return None
+        return doc
+
+
+def read_html_page(url, cookies=None, encoding=None, max_size=None):
+    # parse the raw bytes with the page encoding instead of decoding the whole
+    # page into a str first; libxml2 transcodes while the body streams in
+    feeder = _HtmlFeeder(encoding)
+    result = _download(url, cookies, max_size, feeder)
+    if not result or feeder.parser is None:
+        return None
+
+    doc = feeder.close()
+    if doc is None:
+        # libxml2 gives up at the first invalid byte sequence. Only then pay
+        # for decoding in python, dropping the bad bytes
+        if not feeder.keep:
+            # bytes not kept, a rare case worth a second download
+            result = _download(url, cookies, max_size)
+            if not result:
+                return None
+        start = time.perf_counter()
+        data = b"".join(result[1])
+        if feeder.encoding:
+            data = data.decode(feeder.encoding, errors="ignore")
+        doc = html.document_fromstring(data)
+        feeder.parse_time += time.perf_counter() - start
+    metrics.record_parse("html", feeder.parse_time)
+    return doc
+
+
+def read_xml_page(url, cookies=None, max_size=None):
+    # feeds are parsed as they stream in; libxml2 reads the encoding from the
+    # xml declaration
+    parser = etree.XMLParser(recover=True)
+    parse_time = [0]
+
+    def feed(headers, chunk):
+        start = time.perf_counter()
+        parser.feed(chunk)
+        parse_time[0] += time.perf_counter() - start
+
+    result = _download(url, cookies, max_size, feed)
+    if not result or not result[2]:
+        return None
+    start = time.perf_counter()
+    doc = parser.close()
+    metrics.record_parse("xml", parse_time[0] + time.perf_counter() - start)
+    return doc
+
+
+def read_xml_items(url, tag, handle, cookies=None, max_size=None):
+    # for feeds with large items: handle(element) is called on each <tag>
+    # element as soon as it has arrived, and the element is then dropped from
+    # the tree. Returns False if the feed couldn't be downloaded in full
+    parser = etree.XMLPullParser(events=("end",), tag=tag, recover=True)
+    parse_time = [0]
+
+    def handle_items():
+        for (_, element) in parser.read_events():
+            handle(element)
+            element.clear()
+            # and the items before it
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    def feed(headers, chunk):
+        start = time.perf_counter()
+        parser.feed(chunk)
+        handle_items()
+        parse_time[0] += time.perf_counter() - start
+
+    result = _download(url, cookies, max_size, feed)
+    if not result or not result[2]:
+        return False
+    start = time.perf_counter()
+    try:
+        parser.close()
+    except etree.XMLSyntaxError:
+        pass
+    handle_items()
+    metrics.record_parse("xml", parse_time[0] + time.perf_counter() - start)
+    return True
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# JSON encoding / decoding through the fastest library installed: orjson,
+# then ujson, then the standard library. NEWSSUM_JSON (orjson / ujson / json)
+# forces one of them.
+#
+# loads() takes bytes as downloaded, without decoding them first. dumps()
+# returns utf-8 bytes with non-ASCII text left as is rather than \u escaped,
+# which makes the Chinese payloads about half the size.
+
+import os
+import json
+
+# name -> (loads, dumps), in order of preference
+BACKENDS = {}
+
+
+def _json_backend():
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode(
+            "utf-8"
+        )
+
+    # json.loads detects the encoding of bytes itself
+    return (json.loads, dumps)
+
+
+def _orjson_backend():
+    import orjson
+
+    return (orjson.loads, orjson.dumps)
+
+
+def _ujson_backend():
+    import ujson
+
+    def loads(data):
+        # not every version of ujson takes bytes
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode("utf-8")
+        return ujson.loads(data)
+
+    def dumps(obj):
+        return ujson.dumps(
+            obj, ensure_ascii=False, escape_forward_slashes=False
+        ).encode("utf-8")
+
+    return (loads, dumps)
+
+
+for (_name, _make) in (
+    ("orjson", _orjson_backend),
+    ("ujson", _ujson_backend),
+    ("json", _json_backend),
+):
+    try:
+        BACKENDS[_name] = _make()
+    except ImportError:
+        pass
+
+_current = {}
+
+
+def use(name=None):
+    # switch to the named backend, or the preferred one installed
+    if name is None:
+        name = next(iter(BACKENDS))
+    if name not in BACKENDS:
+        raise ValueError("json backend not available: " + name)
+    (_current["loads"], _current["dumps"]) = BACKENDS[name]
+    _current["name"] = name
+
+
+def backend():
+    return _current["name"]
+
+
+def loads(data):
+    # data as bytes or str
+    return _current["loads"](data)
+
+
+def dumps(obj):
+    return _current["dumps"](obj)
+
+
+use(os.environ.get("NEWSSUM_JSON") or None)
@@ -18,15 +18,140 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+# Structured logging. Each record is written to stderr as one JSON object,
+# tagged with the source and section being refreshed and the request trace id,
+# plus any url / duration given by the caller. Records are handed to a
+# background thread through a queue so the request thread never waits on
+# stderr, and repeats of the same error are dropped for RATE_LIMIT_WINDOW
+# seconds so a flapping upstream can't flood the log.
+
 import sys
+import json
+import atexit
+import time
+import queue
+import logging
+import threading
+import traceback
+import logging.handlers
+
+import metrics
+import tracing
+from context import source_id, current_section
+
+# identical errors are logged at most once per window (seconds); the number
+# dropped in between is reported on the next one let through
+RATE_LIMIT_WINDOW = 60
+# records waiting for the writer thread; more than this are dropped
+MAX_QUEUE_SIZE = 10000
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "severity": record.levelname,
+            "message": record.getMessage(),
+        }
+        for field in ("source", "section", "url", "duration", "trace", "suppressed"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = "".join(traceback.format_exception(*record.exc_info))
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, window=RATE_LIMIT_WINDOW):
+        logging.Filter.__init__(self)
+        self.window = window
+        self._lock = threading.Lock()
+        # key -> [time last let through, number dropped since]
+        self._seen = {}
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+
+        exc = record.exc_info[1] if record.exc_info else None
+        key = (
+            record.getMessage(),
+            getattr(record, "source", None),
+            getattr(record, "section", None),
+            type(exc).__name__,
+            str(exc),
+        )
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen and now - seen[0] < self.window:
+                seen[1] += 1
+                return False
+            if seen and seen[1]:
+                record.suppressed = seen[1]
+            self._seen[key] = [now, 0]
+            if len(self._seen) > 1000:
+                self._seen = {
+                    k: v for (k, v) in self._seen.items() if now - v[0] < self.window
+                }
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # formatting (incl. the traceback) happens on the writer thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
 
 
 class MyLogger:
-    def info(self, msg):
-        print(msg, file=sys.stderr)
+    def __init__(self, stream=sys.stderr):
+        self._logger = logging.getLogger("newssum")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        log_queue = queue.Queue(MAX_QUEUE_SIZE)
+        queue_handler = _DroppingQueueHandler(log_queue)
+        queue_handler.addFilter(RateLimitFilter())
+        self._logger.addHandler(queue_handler)
+        self._listener = logging.handlers.QueueListener(log_queue, handler)
+        self._listener.start()
+        atexit.register(self._listener.stop)
+
+    def _log(self, level, msg, exc=None, url=None, duration=None):
+        extra = {
+            "source": source_id(),
+            "section": current_section.get(),
+            "url": url,
+            "trace": tracing.trace_id(),
+            "duration": round(duration, 4) if duration is not None else None,
+        }
+        exc_info = (type(exc), exc, exc.__traceback__) if exc is not None else None
+        self._logger.log(level, msg, exc_info=exc_info, extra=extra)
+
+    def info(self, msg, url=None, duration=None):
+        self._log(logging.INFO, msg, url=url, duration=duration)
+
+    def warning(self, msg, url=None, duration=None):
+        self._log(logging.WARNING, msg, url=url, duration=duration)
+
+    def exception(self, msg, exc=None, url=None, duration=None):
+        # exc defaults to the exception being handled
+        metrics.record_error()
+        self._log(logging.ERROR, msg, exc or sys.exc_info()[1], url, duration)
 
-    def exception(self, msg):
-        print(msg, file=sys.stderr)
+    def flush(self):
+        # wait for queued records to be written, e.g. before exiting
+        self._listener.stop()
+        self._listener.start()
 
 
 logger = MyLogger()
@@ -20,26 +20,71 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from flask import jsonify, send_from_directory
-from flask import Flask
+from flask import send_from_directory
+from flask import Flask, Response
 from flask_cors import CORS
 
 from util import get_sources
+from dedup import merge_feeds
+from cluster import HeadlineClusterer
+from search import SearchIndex
+import pipeline
+import metrics
+import tracing
+import profiler
+import jsoncodec
 
 allSources = get_sources()
+headlineClusterer = HeadlineClusterer()
+searchIndex = SearchIndex()
 
 app = Flask(__name__, static_url_path="", static_folder="static")
 CORS(app)
 
 
+def _json_response(data):
+    # instead of jsonify, for the faster encoder and unescaped CJK text
+    return app.response_class(jsoncodec.dumps(data), mimetype="application/json")
+
+
+def serialise(route, data):
+    from flask import request, g
+
+    with tracing.span("serialise", route=route):
+        with metrics.SERIALISE_SECONDS.time(route=route):
+            response = _json_response(data)
+
+    # debugging aid, e.g. /appledaily?trace=1 returns where the time went
+    if request.args.get("trace"):
+        (root, _) = g.trace
+        response = _json_response({"result": data, "trace": root.to_dict()})
+        response.cache_control.no_cache = True
+    return response
+
+
+def fetch_articles(id):
+    articles = pipeline.refresh(allSources[id])
+    headlineClusterer.update(id, articles)
+    searchIndex.update(id, articles)
+    return articles
+
+
+def fetch_many(ids):
+    results = pipeline.refresh_many([allSources[id] for id in ids])
+    for (id, articles) in zip(ids, results):
+        headlineClusterer.update(id, articles)
+        searchIndex.update(id, articles)
+    return results
+
+
 # route for source listing
 @app.route("/list", methods=["GET"])
 def route_list():
     src = []
     for id in allSources:
-        src.append({"path": id, "desc": allSources[id].get_desc()})
+        src.append({"path": id, "desc": allSources.get_desc(id)})
 
-    return jsonify(src)
+    return serialise("list", src)
 
 
 # route for sources
@@ -49,14 +94,94 @@ def route_source():
     from flask import request
 
     thePath = request.path.strip("/")
-    if thePath in allSources:
+    if profiler.authorised(request.args.get("profile")):
+        # profile the refresh of this source and return the sampled stacks
+        with profiler.Sampler() as sampler:
+            fetch_articles(thePath)
+        response = Response(sampler.collapsed(), mimetype="text/plain")
+        response.cache_control.no_cache = True
+        return response
+
+    if allSources.get(thePath) is not None:
         # try to retrieve from cache
         # encodedArticles = memcache.get(thePath)
         encodedArticles = None
         if encodedArticles is None:
-            articles.extend(allSources[thePath].get_articles())
+            with profiler.maybe_sample():
+                articles.extend(fetch_articles(thePath))
+
+    return serialise("source", articles)
+
+
+# route for several sources combined, e.g. /combined?src=udn,money-udn
+# or all editions of an outlet, e.g. /combined?family=singtao
+# stories carried by more than one of the sources are only listed once
+@app.route("/combined", methods=["GET"])
+def route_combined():
+    from flask import request
+
+    ids = [id for id in request.args.get("src", "").split(",") if id in allSources]
+    for name in request.args.get("family", "").split(","):
+        if name:
+            ids.extend(id for id in allSources.family(name) if id not in ids)
+    # as unknown ids, sources whose class has gone are left out
+    ids = [id for id in ids if allSources.get(id) is not None]
+
+    # refreshed together, so the editions of a family share connections to
+    # their site within its connection limit
+    feeds = zip([allSources.get_desc(id) for id in ids], fetch_many(ids))
+    return serialise("combined", merge_feeds(feeds))
+
+
+# route for stories carried by several outlets, e.g. /topstories?n=20
+# built from the latest articles of every source that has been fetched
+@app.route("/topstories", methods=["GET"])
+def route_topstories():
+    from flask import request
+
+    articles = []
+    for group in headlineClusterer.clusters()[: request.args.get("n", 20, type=int)]:
+        articles.append({"title": group[0][1]["title"]})
+        for (id, article) in group:
+            articles.append(dict(article, source=allSources.get_desc(id)))
+
+    return serialise("topstories", articles)
+
 
-    return jsonify(articles)
+# route for searching headlines and abstracts, e.g. /search?q=typhoon&n=50
+# covers the latest articles of every source that has been fetched
+@app.route("/search", methods=["GET"])
+def route_search():
+    from flask import request
+
+    articles = []
+    for (id, article) in searchIndex.search(
+        request.args.get("q", ""), request.args.get("n", 50, type=int)
+    ):
+        articles.append(dict(article, source=allSources.get_desc(id)))
+
+    return serialise("search", articles)
+
+
+# route for the profile sampled from live requests, see profiler.py
+@app.route("/profile", methods=["GET"])
+def route_profile():
+    from flask import request
+
+    if profiler.authorised(request.args.get("token")):
+        response = Response(profiler.continuous_profile(), mimetype="text/plain")
+    else:
+        response = Response("Forbidden", status=403)
+    response.cache_control.no_cache = True
+    return response
+
+
+# route for prometheus scraping
+@app.route("/metrics", methods=["GET"])
+def route_metrics():
+    response = Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+    response.cache_control.no_cache = True
+    return response
 
 
 # register routes for available sources
@@ -64,11 +189,28 @@ for id in allSources:
     app.route("/" + id, methods=["GET"])(route_source)
 
 
+# every request is the root of a trace
+@app.before_request
+def start_trace():
+    from flask import request, g
+
+    g.trace = tracing.begin(request.method + " " + request.path)
+
+
+@app.teardown_request
+def end_trace(exc):
+    from flask import g
+
+    if "trace" in g:
+        tracing.end(g.pop("trace"))
+
+
 # since we don't have memcache in GCP py3, tell browsers to cache everything to minimize our traffic
 @app.after_request
 def add_header(response):
-    response.cache_control.public = True
-    response.cache_control.max_age = 900
+    if not response.cache_control.no_cache:
+        response.cache_control.public = True
+        response.cache_control.max_age = 900
     return response
 
 
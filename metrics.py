@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Counters and histograms for fetch / parse / serialise work, labelled by
+# source and section, rendered in the Prometheus text format at /metrics.
+
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from context import source_id, current_section
+import tracing
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# number of urls to keep page size stats for; least recently fetched go first
+MAX_TRACKED_URLS = 2000
+# of those, the urls with the largest pages shown in /metrics
+LARGEST_PAGES = 10
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, _escape(v)) for (k, v) in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(
+            "" if labels.get(n) is None else labels[n] for n in self.labelnames
+        )
+
+    def render(self):
+        lines = [
+            "# HELP {} {}".format(self.name, self.documentation),
+            "# TYPE {} {}".format(self.name, self.kind),
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for (key, value) in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [
+            self.name
+            + _format_labels(self.labelnames, key)
+            + " "
+            + _format_value(value)
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        _Metric.__init__(self, name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per bucket counts (not cumulative), then sum and count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for (i, bound) in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, key, value):
+        (counts, total, count) = value
+        lines = []
+        cumulative = 0
+        for (bound, n) in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(
+                self.name
+                + "_bucket"
+                + _format_labels(
+                    self.labelnames, key, [("le", _format_value(float(bound)))]
+                )
+                + " "
+                + str(cumulative)
+            )
+        labels = _format_labels(self.labelnames, key)
+        lines.append(
+            self.name
+            + "_bucket"
+            + _format_labels(self.labelnames, key, [("le", "+Inf")])
+            + " "
+            + str(count)
+        )
+        lines.append(self.name + "_sum" + labels + " " + _format_value(total))
+        lines.append(self.name + "_count" + labels + " " + str(count))
+        return lines
+
+
+FETCH_SECONDS = Histogram(
+    "newssum_fetch_seconds",
+    "Time to download a page, including streaming the body",
+    ("source", "section"),
+)
+FETCH_BYTES = Counter(
+    "newssum_fetch_bytes_total", "Bytes downloaded", ("source", "section")
+)
+FETCH_ERRORS = Counter(
+    "newssum_fetch_errors_total",
+    "Downloads that failed or were over the size limit",
+    ("source", "section"),
+)
+PAGE_BYTES = Histogram(
+    "newssum_page_bytes", "Size of downloaded pages", ("source",), SIZE_BUCKETS
+)
+PARSE_SECONDS = Histogram(
+    "newssum_parse_seconds",
+    "Time spent parsing html, xml or json",
+    ("source", "section", "format"),
+)
+REFRESH_SECONDS = Histogram(
+    "newssum_refresh_seconds",
+    "Time for get_articles and post-processing of a source",
+    ("source",),
+)
+REFRESH_ERRORS = Counter(
+    "newssum_refresh_errors_total",
+    "Exceptions caught while a source was refreshing",
+    ("source", "section"),
+)
+ARTICLES = Counter(
+    "newssum_articles_total", "Articles returned by refreshes", ("source", "section")
+)
+SERIALISE_SECONDS = Histogram(
+    "newssum_serialise_seconds", "Time to encode a json response", ("route",)
+)
+CACHE_REQUESTS = Counter(
+    "newssum_cache_requests_total", "Cache lookups by result", ("cache", "result")
+)
+
+_lock = threading.Lock()
+# url -> [fetch count, total bytes, max bytes, last bytes]. Only the largest
+# LARGEST_PAGES go to /metrics, a series per url would be too many
+_page_sizes = OrderedDict()
+
+
+def _labels(**extra):
+    labels = {"source": source_id(), "section": current_section.get()}
+    labels.update(extra)
+    return labels
+
+
+def record_fetch(seconds, size, ok):
+    labels = _labels()
+    FETCH_SECONDS.observe(seconds, **labels)
+    FETCH_BYTES.inc(size, **labels)
+    PAGE_BYTES.observe(size, source=labels["source"])
+    if not ok:
+        FETCH_ERRORS.inc(**labels)
+
+
+@contextmanager
+def parse_timer(format):
+    with tracing.span("parse", format=format):
+        with PARSE_SECONDS.time(**_labels(format=format)):
+            yield
+
+
+def record_parse(format, seconds):
+    PARSE_SECONDS.observe(seconds, **_labels(format=format))
+    tracing.add_span("parse", seconds, format=format)
+
+
+def record_error():
+    REFRESH_ERRORS.inc(**_labels())
+
+
+def record_articles(source, articles):
+    # articles are counted against the section title preceding them
+    section = None
+    counts = {}
+    for article in articles:
+        if article.get("url"):
+            counts[section] = counts.get(section, 0) + 1
+        else:
+            section = article.get("title")
+    for (section, count) in counts.items():
+        ARTICLES.inc(count, source=source, section=section)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_page_size(url, size):
+    with _lock:
+        stats = _page_sizes.pop(url, None) or [0, 0, 0, 0]
+        stats[0] += 1
+        stats[1] += size
+        stats[2] = max(stats[2], size)
+        stats[3] = size
+        _page_sizes[url] = stats
+        while len(_page_sizes) > MAX_TRACKED_URLS:
+            _page_sizes.popitem(last=False)
+
+
+def page_sizes(limit=None):
+    # stats of the urls fetched recently, largest pages first
+    with _lock:
+        items = sorted(_page_sizes.items(), key=lambda item: -item[1][2])
+    return {
+        url: {"count": s[0], "total": s[1], "max": s[2], "last": s[3]}
+        for (url, s) in items[:limit]
+    }
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+
+    lines.append(
+        "# HELP newssum_largest_page_bytes Largest download of the urls with the"
+        " biggest pages"
+    )
+    lines.append("# TYPE newssum_largest_page_bytes gauge")
+    for (url, stats) in page_sizes(LARGEST_PAGES).items():
+        lines.append(
+            "newssum_largest_page_bytes"
+            + _format_labels(["url"], [url])
+            + " "
+            + str(stats["max"])
+        )
+    return "\n".join(lines) + "\n"
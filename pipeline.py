@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Post-processing applied to the articles of a source each time it is refreshed.
+
+import re
+import time
+from lxml import etree
+from lxml import html
+
+from context import source_scope
+import metrics
+import tracing
+import executors
+
+# abstracts longer than this (in characters) are truncated. None to keep all
+ABSTRACT_MAX_LENGTH = 200
+
+_whitespace = re.compile(r"\s+")
+
+
+def sanitize_abstract(abstract, max_length=ABSTRACT_MAX_LENGTH):
+    if not abstract:
+        return abstract
+
+    text = abstract
+    if "<" in text or "&" in text:
+        # many feeds put html (images, links, entities) in their abstracts
+        root = html.fragment_fromstring(text, create_parent="div")
+        etree.strip_elements(root, "script", "style", with_tail=False)
+        text = root.text_content()
+
+    text = _whitespace.sub(" ", text).strip()
+    if max_length and len(text) > max_length:
+        text = text[:max_length].rstrip() + "…"
+    return text or None
+
+
+def sanitize_abstracts(articles):
+    for article in articles:
+        if article.get("abstract"):
+            try:
+                article["abstract"] = sanitize_abstract(article["abstract"])
+            except (etree.ParserError, ValueError):
+                article["abstract"] = None
+    return articles
+
+
+# stages run in order over the article list returned by get_articles
+STAGES = [sanitize_abstracts]
+
+
+def process(articles):
+    for stage in STAGES:
+        articles = stage(articles)
+    return articles
+
+
+def refresh(source, executor=None):
+    # executor (in this process by default, see executors.py) runs get_articles
+    executor = executor or executors.LOCAL
+    with source_scope(source), tracing.span("refresh", source=source.get_id()):
+        with metrics.REFRESH_SECONDS.time(source=source.get_id()):
+            with tracing.span("get_articles", executor=executor.name):
+                (articles, _) = executor.get_articles([source])[0]
+            with tracing.span("process"):
+                articles = process(articles)
+        metrics.record_articles(source.get_id(), articles)
+        return articles
+
+
+def refresh_many(sources, executor=None):
+    # several sources at once, their get_articles side by side in the executor
+    executor = executor or executors.current()
+    with tracing.span("get_articles", executor=executor.name, sources=len(sources)):
+        results = executor.get_articles(sources)
+
+    # each source is then timed as refresh() would: its get_articles (as timed
+    # by the executor) plus its processing, under a "refresh" span of its own
+    for (n, source) in enumerate(sources):
+        (articles, seconds) = results[n]
+        id = source.get_id()
+        start = time.perf_counter()
+        with source_scope(source), tracing.span("refresh", source=id) as s:
+            s.backdate(seconds)
+            tracing.add_span("get_articles", seconds, executor=executor.name)
+            with tracing.span("process"):
+                articles = process(articles)
+        metrics.REFRESH_SECONDS.observe(
+            seconds + time.perf_counter() - start, source=id
+        )
+        metrics.record_articles(id, articles)
+        results[n] = articles
+    return results
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Sampling profiler for live requests. A background thread wakes up every
+# INTERVAL seconds and records the python stack of the threads doing the work
+# of the request, so the request itself runs at full speed. Those are the
+# thread that started the profiler and the workers that context.worker_scope
+# registers with it (run_concurrently, the asyncio executor). Stacks are reported in the
+# collapsed format ("frame;frame;frame count" per line) read by flamegraph.pl,
+# speedscope and friends.
+#
+# Profiling is off unless NEWSSUM_PROFILE_TOKEN is set. Then a source can be
+# profiled with /<source>?profile=<token>, and with NEWSSUM_PROFILE_SAMPLE_RATE
+# set to e.g. 0.01, that fraction of requests is sampled continuously into a
+# profile served at /profile?token=<token>.
+
+import os
+import sys
+import hmac
+import random
+import threading
+from collections import Counter
+
+from context import current_sampler
+
+PROFILE_TOKEN = os.environ.get("NEWSSUM_PROFILE_TOKEN")
+SAMPLE_RATE = float(os.environ.get("NEWSSUM_PROFILE_SAMPLE_RATE", 0))
+# seconds between samples
+INTERVAL = 0.005
+# distinct stacks kept by the continuous profile; later new ones are lumped together
+MAX_STACKS = 5000
+
+_app_dir = os.path.dirname(os.path.abspath(__file__)) + os.sep
+_labels = {}
+_lock = threading.Lock()
+_continuous = Counter()
+
+
+def authorised(token):
+    return bool(PROFILE_TOKEN and token) and hmac.compare_digest(
+        token.encode("utf-8"), PROFILE_TOKEN.encode("utf-8")
+    )
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(_app_dir):
+            filename = filename.replace(_app_dir, "", 1)
+        else:
+            filename = os.path.basename(filename)
+        label = "{} ({}:{})".format(code.co_name, filename, code.co_firstlineno)
+        _labels[code] = label
+    return label
+
+
+def _stack(frame):
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+class Sampler:
+    # samples the thread that starts it, plus the threads working for it
+    # meanwhile (see context.worker_scope). Other requests served at the same
+    # time are left out
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        # thread id -> number of worker_scopes it is in
+        self._threads = Counter()
+        self._thread = None
+        self._token = None
+        self._stop = threading.Event()
+
+    def add_thread(self, ident):
+        with self._lock:
+            self._threads[ident] += 1
+
+    def remove_thread(self, ident):
+        with self._lock:
+            self._threads[ident] -= 1
+            if not self._threads[ident]:
+                del self._threads[ident]
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                threads = set(self._threads)
+            frames = sys._current_frames()
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_stack(frame)] += 1
+            self.samples += 1
+
+    def start(self):
+        self.add_thread(threading.get_ident())
+        self._token = current_sampler.set(self)
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        current_sampler.reset(self._token)
+        self.remove_thread(threading.get_ident())
+        return self.stacks
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def collapsed(self):
+        return collapse(self.stacks)
+
+
+def collapse(stacks):
+    return "".join(
+        "{} {}\n".format(stack, count) for (stack, count) in stacks.most_common()
+    )
+
+
+class _ContinuousSample:
+    def __init__(self):
+        self._sampler = None
+
+    def __enter__(self):
+        if SAMPLE_RATE and random.random() < SAMPLE_RATE:
+            self._sampler = Sampler().start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._sampler is not None:
+            stacks = self._sampler.stop()
+            with _lock:
+                for (stack, count) in stacks.items():
+                    if stack not in _continuous and len(_continuous) >= MAX_STACKS:
+                        stack = "[other]"
+                    _continuous[stack] += count
+
+
+def maybe_sample():
+    # profile the block for a SAMPLE_RATE fraction of calls
+    return _ContinuousSample()
+
+
+def continuous_profile():
+    with _lock:
+        return collapse(_continuous)
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Record / replay of upstream pages, so sources can be run without network.
+#
+#   python replay.py record [SOURCE ...]
+#   python replay.py replay [SOURCE ...] [--latency SECONDS]
+#
+# In record mode every response the fetcher downloads in full is saved under
+# FIXTURES_DIR/<source>/: the body as is, plus url, cookies, status and
+# headers in index.json. In replay mode the fetcher serves those files
+# instead of going to the network, optionally after a simulated latency; a
+# page that wasn't recorded fails like an unreachable one.
+#
+# The mode can also be chosen with NEWSSUM_FETCH_MODE (record / replay),
+# NEWSSUM_FIXTURES_DIR and NEWSSUM_REPLAY_LATENCY, e.g. to run the app itself
+# on fixtures.
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+
+from urllib3._collections import HTTPHeaderDict
+
+from context import source_id
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.environ.get("NEWSSUM_FIXTURES_DIR", os.path.join(HERE, "fixtures"))
+# pages fetched outside the refresh of a source
+SHARED = "_shared"
+
+# some sources put today's date in their urls. If a replayed url isn't found
+# as is, it is looked up again with dates masked
+_date = re.compile(r"20\d{6}")
+
+_settings = {
+    "mode": os.environ.get("NEWSSUM_FETCH_MODE"),
+    "directory": FIXTURES_DIR,
+    "latency": float(os.environ.get("NEWSSUM_REPLAY_LATENCY", 0)),
+}
+_lock = threading.Lock()
+# source -> {key: entry}, as in the source's index.json
+_indexes = {}
+
+
+def configure(mode, directory=FIXTURES_DIR, latency=0):
+    # mode is "record", "replay" or None for the network
+    with _lock:
+        _settings.update(mode=mode, directory=directory, latency=latency)
+        _indexes.clear()
+
+
+def mode():
+    return _settings["mode"]
+
+
+def settings():
+    # (mode, directory, latency), to configure another process the same way
+    return (_settings["mode"], _settings["directory"], _settings["latency"])
+
+
+def _cookie_string(cookies):
+    return ";".join(
+        "%s=%s" % (key, value) for (key, value) in sorted((cookies or {}).items())
+    )
+
+
+def _key(url, cookies):
+    cookies = _cookie_string(cookies)
+    return url + " " + cookies if cookies else url
+
+
+def _index_path(source):
+    return os.path.join(_settings["directory"], source, "index.json")
+
+
+def _index(source):
+    # callers hold _lock
+    if source not in _indexes:
+        try:
+            with open(_index_path(source), encoding="utf-8") as f:
+                _indexes[source] = json.load(f)
+        except (OSError, ValueError):
+            _indexes[source] = {}
+    return _indexes[source]
+
+
+def _find(index, url, cookies):
+    entry = index.get(_key(url, cookies))
+    if entry is None:
+        masked = _date.sub("", _key(url, cookies))
+        for (key, candidate) in index.items():
+            if _date.sub("", key) == masked:
+                return candidate
+    return entry
+
+
+class FixtureResponse:
+    # the parts of a urllib3 response the fetcher uses
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = HTTPHeaderDict(headers)
+        self._body = body
+
+    def stream(self, amt):
+        for start in range(0, len(self._body), amt):
+            end = start + amt
+            yield self._body[start:end]
+
+    def drain_conn(self):
+        pass
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class RecordingResponse:
+    # passes a live response through, saving it once read to the end
+    def __init__(self, response, url, cookies):
+        self._response = response
+        self._url = url
+        self._cookies = cookies
+        self._source = source_id() or SHARED
+        self.status = response.status
+        self.headers = response.headers
+
+    def stream(self, amt):
+        chunks = []
+        for chunk in self._response.stream(amt):
+            chunks.append(chunk)
+            yield chunk
+        save(
+            self._source,
+            self._url,
+            self._cookies,
+            self.status,
+            self.headers,
+            b"".join(chunks),
+        )
+
+    def drain_conn(self):
+        self._response.drain_conn()
+
+    def close(self):
+        self._response.close()
+
+    def release_conn(self):
+        self._response.release_conn()
+
+
+def save(source, url, cookies, status, headers, body):
+    key = _key(url, cookies)
+    directory = os.path.join(_settings["directory"], source)
+    name = hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + ".body"
+    with _lock:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(body)
+        index = _index(source)
+        index[key] = {
+            "url": url,
+            "cookies": cookies or {},
+            "status": status,
+            "headers": dict(headers),
+            "body": name,
+        }
+        with open(_index_path(source), "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def sources():
+    # names of the folders holding fixtures
+    try:
+        return sorted(os.listdir(_settings["directory"]))
+    except OSError:
+        return []
+
+
+def load(url, cookies=None, source=None):
+    # the recorded response for url, or None if there is none. Looked up in
+    # the fixtures of source, by default the one being refreshed
+    source = source or source_id() or SHARED
+    with _lock:
+        entry = _find(_index(source), url, cookies)
+        if entry is None and source != SHARED:
+            entry = _find(_index(SHARED), url, cookies)
+            source = SHARED
+    if entry is None:
+        return None
+
+    if _settings["latency"]:
+        time.sleep(_settings["latency"])
+    path = os.path.join(_settings["directory"], source, entry["body"])
+    try:
+        with open(path, "rb") as f:
+            return FixtureResponse(entry["status"], entry["headers"], f.read())
+    except OSError:
+        return None
+
+
+def clear(source):
+    with _lock:
+        _indexes.pop(source, None)
+        shutil.rmtree(os.path.join(_settings["directory"], source), ignore_errors=True)
+
+
+def _summary(articles):
+    digest = hashlib.sha1(
+        json.dumps(articles, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return "{} items, {} articles, digest {}".format(
+        len(articles), sum(1 for a in articles if a.get("url")), digest[:12]
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="record / replay upstream pages")
+    parser.add_argument("mode", choices=("record", "replay"))
+    parser.add_argument("sources", nargs="*", help="source ids, default all")
+    parser.add_argument("--directory", default=FIXTURES_DIR, help="fixtures folder")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="delay per replayed page (seconds)"
+    )
+    args = parser.parse_args()
+
+    # run as a script this module is __main__; the fetcher uses the one
+    # imported as "replay", so that is the one to configure
+    import replay
+
+    replay.configure(args.mode, args.directory, args.latency)
+
+    import pipeline
+    from util import get_sources
+
+    allSources = get_sources()
+    for id in args.sources or list(allSources):
+        if id not in allSources:
+            sys.exit("unknown source " + id)
+        if args.mode == "record":
+            replay.clear(id)
+        source = allSources[id]
+        start = time.perf_counter()
+        articles = pipeline.refresh(source)
+        print(
+            "{:24} {:6.2f}s  {}".format(
+                id, time.perf_counter() - start, _summary(articles)
+            )
+        )
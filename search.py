@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+import re
+import threading
+import time
+import unicodedata
+
+# a match in the title counts this many times a match in the abstract
+TITLE_WEIGHT = 3
+# score of an article halves every RECENCY_HALF_LIFE seconds since first seen
+RECENCY_HALF_LIFE = 12 * 60 * 60
+
+# runs of CJK ideographs (plus kana / hangul) or of latin letters and digits
+_token_re = re.compile(
+    r"([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)|([0-9a-z]+)"
+)
+
+
+def tokenize(text):
+    # english is split into words; CJK text has no word boundaries so it is
+    # indexed as overlapping character bigrams
+    tokens = []
+    if not text:
+        return tokens
+    for m in _token_re.finditer(unicodedata.normalize("NFKC", text).lower()):
+        cjk, word = m.groups()
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i] + cjk[i + 1] for i in range(len(cjk) - 1))
+    return tokens
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # term -> {doc id: weighted term frequency}
+        self._postings = {}
+        # doc id -> (source id, article, first seen, terms)
+        self._docs = {}
+        # source id -> {url: doc id}
+        self._sources = {}
+        self._next_id = 0
+
+    def _terms(self, article):
+        terms = {}
+        for term in tokenize(article.get("title")):
+            terms[term] = terms.get(term, 0) + TITLE_WEIGHT
+        for term in tokenize(article.get("abstract")):
+            terms[term] = terms.get(term, 0) + 1
+        return terms
+
+    def _remove(self, doc_id):
+        (_, _, _, terms) = self._docs.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def _add(self, source_id, article, first_seen):
+        doc_id = self._next_id
+        self._next_id += 1
+        terms = self._terms(article)
+        self._docs[doc_id] = (source_id, article, first_seen, terms)
+        for (term, tf) in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        return doc_id
+
+    def update(self, source_id, articles):
+        # only articles that are new or changed since the last refresh of the
+        # source are (re)indexed; those that disappeared are dropped
+        now = time.time()
+        with self._lock:
+            old = self._sources.get(source_id, {})
+            current = {}
+            for article in articles:
+                url = article.get("url")
+                if not url or url in current:
+                    continue
+                doc_id = old.pop(url, None)
+                if doc_id is not None:
+                    (_, indexed, first_seen, _) = self._docs[doc_id]
+                    if (indexed.get("title"), indexed.get("abstract")) != (
+                        article.get("title"),
+                        article.get("abstract"),
+                    ):
+                        self._remove(doc_id)
+                        doc_id = self._add(source_id, article, first_seen)
+                else:
+                    doc_id = self._add(source_id, article, now)
+                current[url] = doc_id
+
+            for doc_id in old.values():
+                self._remove(doc_id)
+            self._sources[source_id] = current
+
+    def search(self, query, limit=50):
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        now = time.time()
+        with self._lock:
+            postings = [self._postings.get(term, {}) for term in terms]
+            postings.sort(key=len)
+            # every query term must match; start from the rarest one
+            candidates = set(postings[0])
+            for p in postings[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(p)
+            if not candidates:
+                return []
+
+            total = float(len(self._docs))
+            idf = [math.log(1 + total / len(p)) for p in postings]
+            scored = []
+            for doc_id in candidates:
+                (source_id, article, first_seen, _) = self._docs[doc_id]
+                score = sum(w * p[doc_id] for (w, p) in zip(idf, postings))
+                score *= 0.5 ** ((now - first_seen) / RECENCY_HALF_LIFE)
+                scored.append((score, doc_id, source_id, article))
+
+        scored.sort(key=lambda s: (s[0], s[1]), reverse=True)
+        return [(source_id, article) for (_, _, source_id, article) in scored[:limit]]
+
+    def __len__(self):
+        return len(self._docs)
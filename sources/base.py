@@ -21,17 +21,45 @@
 # SOFTWARE.
 
 from abc import ABCMeta, abstractmethod
+from datetime import datetime, timedelta
+import json
+import re
+import urllib
+from urllib.parse import urljoin, urlparse
+import pytz
 from lxml import etree
-import traceback
+from lxml import html
 
 from logger import logger
-from fetcher import read_http_page
+from context import section_scope, run_concurrently
+from fetcher import (
+    read_http_page,
+    read_html_page,
+    read_xml_page,
+    read_xml_items,
+    MAX_PAGE_SIZE,
+)
+from metrics import parse_timer
+from cache import TTLCache
+import tracing
+import jsoncodec
+
+# seconds the Fusion deployment id of a site is reused for
+FUSION_DEPLOYMENT_TTL = 30 * 60
+# seconds a list of feeds found on a page (RSSBase.feed_list_url) is reused for
+FEED_LIST_TTL = 12 * 60 * 60
+
+_fusion_deployments = TTLCache("fusion_deployment", FUSION_DEPLOYMENT_TTL)
+_feed_lists = TTLCache("feed_list", FEED_LIST_TTL)
 
 
 class BaseSource:
 
     __metaclass__ = ABCMeta
 
+    # largest page (in bytes) the fetcher downloads for this source
+    max_page_size = MAX_PAGE_SIZE
+
     @abstractmethod
     def get_id(self):
         pass
@@ -44,7 +72,14 @@ class BaseSource:
     def get_articles(self):
         pass
 
+    def get_family(self):
+        # editions of one outlet share a family name, so that they can be
+        # refreshed and listed together (/combined?family=<name>)
+        return None
+
     def create_section(self, title):
+        # the title of a section in the article list. The work of the section
+        # goes in a section_scope, for its logs and metrics
         return {"title": title}
 
     def create_article(self, title, url, abstract=None):
@@ -55,34 +90,61 @@ class RSSBase(BaseSource):
 
     __metaclass__ = ABCMeta
 
-    @abstractmethod
+    # sources that list their feeds on a page set these two instead of
+    # overriding get_rss_links: the page, and the xpath of the feed links in it
+    feed_list_url = None
+    feed_list_xpath = None
+    # in the log of a feed that failed
+    _feed_format = "rss"
+
     def get_rss_links(self):
-        return []
+        # list of (section title, feed url)
+        if not self.feed_list_url:
+            return []
+        return _feed_lists.get_or_set(self.feed_list_url, self._discover_rss_links)
 
-    def get_articles(self):
+    def _discover_rss_links(self):
         resultList = []
-        for (name, url) in self.get_rss_links():
+        try:
+            doc = read_html_page(self.feed_list_url)
+            for aLink in doc.xpath(self.feed_list_xpath):
+                name = aLink.text_content().strip()
+                href = urljoin(self.feed_list_url, aLink.get("href") or "")
+                if name and urlparse(href).scheme in ("http", "https"):
+                    resultList.append((name, href))
+        except Exception as e:
+            logger.exception("Problem fetching rss links", e)
+
+        # an empty list isn't cached, the page is tried again next time
+        return resultList or None
+
+    def _extract_articles(self, doc):
+        # a generator, so a bad entry keeps the ones before it
+        for entry in doc.xpath("//rss/channel/item"):
+            title = entry.xpath("title")[0].text
+            link = entry.xpath("link")[0].text
+            abstract = entry.xpath("description")[0].text
+            yield self.create_article(title.strip(), link, abstract)
+
+    def _get_feed(self, feed):
+        (name, url) = feed
+        with section_scope(name):
+            # for each section, insert a title...
+            resultList = [self.create_section(name)]
             try:
-                # for each section, insert a title...
-                resultList.append(self.create_section(name))
                 # ... then parse the page and extract article links
-                data = read_http_page(url)
-                if data:
-                    doc = etree.fromstring(data, parser=etree.XMLParser(recover=True))
-                    for entry in doc.xpath("//rss/channel/item"):
-                        title = entry.xpath("title")[0].text
-                        link = entry.xpath("link")[0].text
-                        abstract = entry.xpath("description")[0].text
-                        resultList.append(
-                            self.create_article(title.strip(), link, abstract)
-                        )
+                doc = read_xml_page(url)
+                if doc is not None:
+                    resultList.extend(self._extract_articles(doc))
             except Exception as e:
-                logger.exception("Problem processing rss: " + str(e))
-                logger.exception(
-                    traceback.format_exception(
-                        etype=type(e), value=e, tb=e.__traceback__
-                    )
-                )
+                logger.exception("Problem processing " + self._feed_format, e)
+        return resultList
+
+    def get_articles(self):
+        # feeds are independent, get them at the same time
+        resultList = []
+        for articles in run_concurrently(self._get_feed, self.get_rss_links() or []):
+            resultList.extend(articles)
         return resultList
 
 
@@ -90,35 +152,225 @@ class RDFBase(RSSBase):
 
     __metaclass__ = ABCMeta
 
-    def get_articles(self):
+    _feed_format = "rdf"
+
+    def _extract_articles(self, doc):
+        for entry in doc.xpath('//*[local-name()="RDF"]/*[local-name()="item"]'):
+            titles = entry.xpath('*[local-name()="title"]')
+            links = entry.xpath('*[local-name()="link"]')
+            abstracts = entry.xpath('*[local-name()="description"]')
+            if titles and links:
+                title = titles[0].text
+                link = links[0].text
+                abstract = abstracts[0].text if abstracts else ""
+                yield self.create_article(title.strip(), link, abstract)
+
+
+class DigestRSSBase(RSSBase):
+    # feeds whose items are digests (e.g. of a day), each listing several
+    # articles in html in its description. Every item becomes a section,
+    # titled with the feed's name when it has no title of its own
+
+    __metaclass__ = ABCMeta
+
+    _feed_format = "digest"
+    # compiled once; evaluated on a <div> holding the html of a description
+    _digest_links = etree.XPath("//a")
+
+    def _extract_item(self, item, name):
+        title = item.findtext("title") or name
+        with section_scope(title):
+            resultList = [self.create_section(title)]
+            description = item.find("description")
+            if description is None:
+                return resultList
+            # the html is usually in CDATA, but may also be plain elements
+            markup = (description.text or "") + "".join(
+                etree.tostring(child, encoding="unicode") for child in description
+            )
+            if markup.strip():
+                # only the description is parsed as html
+                fragment = html.fragment_fromstring(markup, create_parent="div")
+                for link in self._digest_links(fragment):
+                    if link.text and link.get("href"):
+                        resultList.append(
+                            self.create_article(link.text.strip(), link.get("href"))
+                        )
+        return resultList
+
+    def _get_feed(self, feed):
+        (name, url) = feed
         resultList = []
-        for (name, url) in self.get_rss_links():
+
+        def handle(item):
             try:
-                # for each section, insert a title...
-                resultList.append(self.create_section(name))
-                # ... then parse the page and extract article links
-                doc = etree.fromstring(
-                    read_http_page(url), parser=etree.XMLParser(recover=True)
-                )
-                if doc is not None:
-                    for entry in doc.xpath(
-                        '//*[local-name()="RDF"]/*[local-name()="item"]'
+                resultList.extend(self._extract_item(item, name))
+            except Exception as e:
+                logger.exception("Problem processing " + self._feed_format, e)
+
+        # items are handled as they arrive, not once the feed is complete
+        if not read_xml_items(url, "item", handle):
+            return []
+        return resultList
+
+
+ATOM_NAMESPACE = "http://www.w3.org/2005/Atom"
+_ATOM_TITLE = "{%s}title" % ATOM_NAMESPACE
+_ATOM_LINK = "{%s}link" % ATOM_NAMESPACE
+_ATOM_SUMMARY = "{%s}summary" % ATOM_NAMESPACE
+
+
+class AtomBase(RSSBase):
+    # Atom feeds, listed in get_rss_links like RSS ones
+
+    __metaclass__ = ABCMeta
+
+    _feed_format = "atom"
+    # compiled once; sources filtering entries override it, in the "atom"
+    # namespace prefix
+    _entries = etree.XPath("//atom:entry", namespaces={"atom": ATOM_NAMESPACE})
+    # type of the link to the article, in order of preference. None matches
+    # links without a type
+    link_types = (None, "text/html")
+    # relative links are resolved against this
+    link_base = None
+    # some feeds put the abstract in an attribute of the link instead of in
+    # a summary element
+    abstract_attribute = None
+
+    def _extract_articles(self, doc):
+        for entry in self._entries(doc):
+            # one pass over the children of the entry
+            title = None
+            links = {}
+            summary = None
+            for child in entry:
+                if child.tag == _ATOM_TITLE:
+                    if title is None:
+                        title = child.text
+                elif child.tag == _ATOM_LINK:
+                    links.setdefault(child.get("type"), child)
+                elif child.tag == _ATOM_SUMMARY:
+                    summary = child.text
+
+            link = next((links[t] for t in self.link_types if t in links), None)
+            if not title or link is None or not link.get("href"):
+                continue
+            url = link.get("href")
+            if self.link_base:
+                url = urljoin(self.link_base, url)
+            if self.abstract_attribute:
+                summary = link.get(self.abstract_attribute)
+            yield self.create_article(title.strip(), url, summary)
+
+
+class FusionBase(BaseSource):
+    # sites built on Arc Fusion. Their query-feed API needs the id of the
+    # current deployment, found in any of their html pages
+
+    __metaclass__ = ABCMeta
+
+    _base_url = None
+    _website = None
+    _timezone = "Hongkong"
+
+    @abstractmethod
+    def get_sections(self):
+        # list of (title, section id)
+        pass
+
+    def _find_deployment_id(self, raw_page):
+        m_d = re.search(r"Fusion\.deployment\=\"([0-9]+)\"", str(raw_page))
+        return m_d.group(1) if m_d else None
+
+    def _deployment_id(self):
+        # one landing page per TTL instead of one per section per refresh
+        def fetch():
+            (_, section_id) = self.get_sections()[0]
+            return self._find_deployment_id(
+                read_http_page(self._base_url + section_id + "/")
+            )
+
+        with tracing.span("deployment_id"):
+            return _fusion_deployments.get_or_set(self._base_url, fetch)
+
+    def _date_id(self):
+        local_time = datetime.now(pytz.timezone(self._timezone))
+        if local_time.hour < 4:
+            local_time = local_time - timedelta(days=1)
+        return local_time.strftime("%Y%m%d")
+
+    def _get_collection(self, section_id, date_id, d):
+        payload_query = {
+            "feedOffset": 0,
+            "feedQuery": 'taxonomy.primary_section._id:"{}" AND type:story AND editor_note:"{}"'.format(
+                section_id, date_id
+            ),
+            "feedSize": 100,
+            "sort": "location:asc",
+        }
+        payload_query = urllib.parse.quote(json.dumps(payload_query))
+
+        query_url = (
+            self._base_url
+            + "/pf/api/v3/content/fetch/query-feed?query={}&d={}&_website={}".format(
+                payload_query, d, self._website
+            )
+        )
+        with tracing.span("get_collection", section=section_id):
+            return read_http_page(query_url)
+
+    def _get_section(self, section, date_id, d):
+        (title, section_id) = section
+        with section_scope(title):
+            # for each section, insert a title...
+            resultList = [self.create_section(title)]
+            try:
+                # ... then retrieve the json content
+                raw_result = self._get_collection(section_id, date_id, d)
+                if raw_result is None:
+                    # maybe redeployed since the id was cached
+                    _fusion_deployments.invalidate(self._base_url)
+                    return resultList
+                with parse_timer("json"):
+                    result = jsoncodec.loads(raw_result)
+                for article in result["content_elements"]:
+                    desc = article["headlines"]["basic"]
+                    href = article["website_url"]
+                    abstract = None
+                    if (
+                        "content_elements" in article
+                        and len(article["content_elements"]) > 1
+                        and "content" in article["content_elements"][0]
                     ):
-                        titles = entry.xpath('*[local-name()="title"]')
-                        links = entry.xpath('*[local-name()="link"]')
-                        abstracts = entry.xpath('*[local-name()="description"]')
-                        if titles and links:
-                            title = titles[0].text
-                            link = links[0].text
-                            abstract = abstracts[0].text if abstracts else ""
-                            resultList.append(
-                                self.create_article(title.strip(), link, abstract)
+                        abstract = article["content_elements"][0]["content"]
+                    if desc and href:
+                        resultList.append(
+                            self.create_article(
+                                desc.strip(), self._base_url + href, abstract
                             )
+                        )
+
             except Exception as e:
-                logger.exception("Problem processing rdf: " + str(e))
-                logger.exception(
-                    traceback.format_exception(
-                        etype=type(e), value=e, tb=e.__traceback__
-                    )
-                )
+                logger.exception("Problem processing url", e)
+
+        return resultList
+
+    def get_articles(self):
+        sections = self.get_sections()
+        try:
+            d = self._deployment_id()
+        except Exception as e:
+            logger.exception("Problem getting deployment id", e)
+            d = None
+        if not d:
+            return [self.create_section(title) for (title, _) in sections]
+
+        # the section queries are independent, send them at the same time
+        date_id = self._date_id()
+        resultList = []
+        for articles in run_concurrently(
+            lambda section: self._get_section(section, date_id, d), sections
+        ):
+            resultList.extend(articles)
         return resultList
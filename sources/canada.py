@@ -21,150 +21,204 @@
 # SOFTWARE.
 
 import re
-from datetime import datetime, timedelta
-from lxml import html
+from abc import ABCMeta, abstractmethod
 from lxml import etree
-import traceback
-import pytz
 
 from logger import logger
-from fetcher import read_http_page
+from context import run_concurrently, section_scope
+from fetcher import read_html_page
 
 from .base import BaseSource
 from .base import RSSBase
+from .base import AtomBase, ATOM_NAMESPACE
+from .edition import EditionDate
 
 
-class MingPaoVancouver(BaseSource):
+def _find_mingpao_date(doc):
+    # the "明報首頁" link points to the front page of the current edition
+    for aLink in doc.get_element_by_id("mp-menu").xpath("//div/ul/li/a"):
+        if aLink.text_content() == u"明報首頁":
+            match = re.match(
+                r"htm\/News\/([0-9]{8})\/main_r\.htm", aLink.attrib["href"]
+            )
+            if match and match.lastindex == 1:
+                return match.group(1)
+    return None
+
+
+_vancouver_edition = EditionDate(
+    "http://www.mingpaocanada.com/Van/", _find_mingpao_date, "America/Vancouver"
+)
+_toronto_edition = EditionDate(
+    "http://www.mingpaocanada.com/TOR/", _find_mingpao_date, "America/Toronto"
+)
+
+
+# the MingPao editions share the page layout
+_mingpao_topics = etree.XPath('//h4[contains(@class, "listing-link")]/a')
+
+
+class MingPaoCanadaBase(BaseSource):
+
+    __metaclass__ = ABCMeta
+
+    # e.g. "Van" in http://www.mingpaocanada.com/Van/htm/News/<date>/
+    _edition_path = None
+    # EditionDate of the edition
+    _edition_date = None
+
+    @abstractmethod
+    def get_sections(self):
+        # list of (title, index page name)
+        return []
+
+    def get_family(self):
+        return "mingpaocanada"
+
+    def _get_section(self, section, baseUrl):
+        (title, page) = section
+        with section_scope(title):
+            # for each section, insert a title...
+            resultList = [self.create_section(title)]
+            try:
+                # ... then parse the page and extract article links
+                doc = read_html_page(baseUrl + page, encoding="big5-hkscs")
+                if doc is not None:
+                    for topic in _mingpao_topics(doc):
+                        if topic.text and topic.get("href"):
+                            resultList.append(
+                                self.create_article(
+                                    topic.text.strip(), baseUrl + topic.get("href")
+                                )
+                            )
+            except Exception as e:
+                logger.exception("Problem processing url", e)
+
+        return resultList
+
+    def get_articles(self):
+        theDate = self._edition_date.get()
+        baseUrl = (
+            "http://www.mingpaocanada.com/"
+            + self._edition_path
+            + "/htm/News/"
+            + theDate
+            + "/"
+        )
+
+        resultList = []
+        for articles in run_concurrently(
+            lambda section: self._get_section(section, baseUrl), self.get_sections()
+        ):
+            resultList.extend(articles)
+        return resultList
+
+
+class MingPaoVancouver(MingPaoCanadaBase):
+
+    _edition_path = "Van"
+    _edition_date = _vancouver_edition
+
     def get_id(self):
         return "mingpaovancouver"
 
     def get_desc(self):
         return "明報加西版(溫哥華)"
 
-    def get_articles(self):
-        # get date first
-        dateUrl = "http://www.mingpaocanada.com/Van/"
-        van_time = datetime.now(pytz.timezone("America/Vancouver"))
-        if van_time.hour < 4:
-            van_time = van_time - timedelta(days=1)
-        theDate = van_time.strftime("%Y%m%d")
-
-        try:
-            doc = html.document_fromstring(read_http_page(dateUrl))
-            for aLink in doc.get_element_by_id("mp-menu").xpath("//div/ul/li/a"):
-                if aLink.text_content() == u"明報首頁":
-                    href = aLink.attrib["href"]
-                    match = re.match(r"htm\/News\/([0-9]{8})\/main_r\.htm", href)
-                    if match and match.lastindex == 1:
-                        theDate = match.group(1)
-                    else:
-                        logger.info("no date found. using system date: " + theDate)
-        except Exception as e:
-            logger.exception("Problem getting date: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
-
-        resultList = []
-        sections = [
-            (
-                "要聞",
-                "http://www.mingpaocanada.com/Van/htm/News/"
-                + theDate
-                + "/VAindex_r.htm",
-            ),
-            (
-                "加國新聞",
-                "http://www.mingpaocanada.com/Van/htm/News/"
-                + theDate
-                + "/VBindex_r.htm",
-            ),
-            (
-                "社區新聞",
-                "http://www.mingpaocanada.com/Van/htm/News/"
-                + theDate
-                + "/VDindex_r.htm",
-            ),
-            (
-                "港聞",
-                "http://www.mingpaocanada.com/Van/htm/News/"
-                + theDate
-                + "/HK-VGindex_r.htm",
-            ),
-            (
-                "國際",
-                "http://www.mingpaocanada.com/Van/htm/News/"
-                + theDate
-                + "/VTindex_r.htm",
-            ),
-            (
-                "中國",
-                "http://www.mingpaocanada.com/Van/htm/News/"
-                + theDate
-                + "/VCindex_r.htm",
-            ),
-            (
-                "經濟",
-                "http://www.mingpaocanada.com/Van/htm/News/"
-                + theDate
-                + "/VEindex_r.htm",
-            ),
-            (
-                "體育",
-                "http://www.mingpaocanada.com/Van/htm/News/"
-                + theDate
-                + "/VSindex_r.htm",
-            ),
-            (
-                "影視",
-                "http://www.mingpaocanada.com/Van/htm/News/"
-                + theDate
-                + "/HK-MAindex_r.htm",
-            ),
-            (
-                "副刊",
-                "http://www.mingpaocanada.com/Van/htm/News/"
-                + theDate
-                + "/WWindex_r.htm",
-            ),
+    def get_sections(self):
+        return [
+            ("要聞", "VAindex_r.htm"),
+            ("加國新聞", "VBindex_r.htm"),
+            ("社區新聞", "VDindex_r.htm"),
+            ("港聞", "HK-VGindex_r.htm"),
+            ("國際", "VTindex_r.htm"),
+            ("中國", "VCindex_r.htm"),
+            ("經濟", "VEindex_r.htm"),
+            ("體育", "VSindex_r.htm"),
+            ("影視", "HK-MAindex_r.htm"),
+            ("副刊", "WWindex_r.htm"),
         ]
 
-        baseUrl = "http://www.mingpaocanada.com/Van/htm/News/" + theDate + "/"
-        try:
-            for (title, url) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
+
+# the SingTao editions are one site, the "edition" cookie picks which.
+# Selectors are shared by the editions
+_singtao_content = '(//div[@class="td-ss-main-content"])[1]'
+_singtao_top_link = etree.XPath(_singtao_content + '/div[@class="cat-header-image"]/a')
+_singtao_top_text = etree.XPath(
+    _singtao_content + '/div[@class="cat-header-image"]/a/div/h3'
+)
+_singtao_topics = etree.XPath(
+    _singtao_content
+    + '/div[contains(@class, "td-animation-stack")]/div[@class="item-details"]/h3/a'
+)
+
+
+class SingTaoBase(BaseSource):
+
+    __metaclass__ = ABCMeta
+
+    # value of the edition cookie
+    _edition = None
+
+    @abstractmethod
+    def get_sections(self):
+        # list of (title, category url)
+        return []
+
+    def get_family(self):
+        return "singtao"
+
+    def _get_section(self, section):
+        (title, url) = section
+        with section_scope(title):
+            # for each section, insert a title...
+            resultList = [self.create_section(title)]
+            try:
                 # ... then parse the page and extract article links
-                doc = html.document_fromstring(
-                    read_http_page(url).decode("big5-hkscs", errors="ignore")
-                )
-                for topic in doc.xpath('//h4[contains(@class, "listing-link")]/a'):
+                doc = read_html_page(url, {"edition": self._edition})
+                if doc is None:
+                    return resultList
+
+                # top story
+                top_story_link = _singtao_top_link(doc)
+                top_story_text = _singtao_top_text(doc)
+                if top_story_link and top_story_text:
+                    resultList.append(
+                        self.create_article(
+                            top_story_text[0].text.strip(),
+                            top_story_link[0].get("href"),
+                        )
+                    )
+
+                for topic in _singtao_topics(doc):
                     if topic.text and topic.get("href"):
                         resultList.append(
-                            self.create_article(
-                                topic.text.strip(), baseUrl + topic.get("href")
-                            )
+                            self.create_article(topic.text.strip(), topic.get("href"))
                         )
+            except Exception as e:
+                logger.exception("Problem processing url", e)
 
-        except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
+        return resultList
 
+    def get_articles(self):
+        resultList = []
+        for articles in run_concurrently(self._get_section, self.get_sections()):
+            resultList.extend(articles)
         return resultList
 
 
-class SingTaoVancouver(BaseSource):
+class SingTaoVancouver(SingTaoBase):
+
+    _edition = "vancouver"
+
     def get_id(self):
         return "singtaovancouver"
 
     def get_desc(self):
         return "星島日報(溫哥華)"
 
-    def get_articles(self):
-        resultList = []
-        sections = [
+    def get_sections(self):
+        return [
             (
                 "要聞",
                 "https://www.singtao.ca/category/52-%E6%BA%AB%E5%93%A5%E8%8F%AF%E8%A6%81%E8%81%9E/?variant=zh-hk",
@@ -211,57 +265,19 @@ class SingTaoVancouver(BaseSource):
             ),
         ]
 
-        try:
-            for (title, url) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then parse the page and extract article links
-                doc = html.document_fromstring(
-                    read_http_page(url, {"edition": "vancouver"}).decode("utf-8")
-                )
-
-                # top story
-                top_story_link = doc.xpath(
-                    '(//div[@class="td-ss-main-content"])[1]/div[@class="cat-header-image"]/a'
-                )
-                top_story_text = doc.xpath(
-                    '(//div[@class="td-ss-main-content"])[1]/div[@class="cat-header-image"]/a/div/h3'
-                )
-                if top_story_link and top_story_text:
-                    resultList.append(
-                        self.create_article(
-                            top_story_text[0].text.strip(),
-                            top_story_link[0].get("href"),
-                        )
-                    )
-
-                for topic in doc.xpath(
-                    '(//div[@class="td-ss-main-content"])[1]/div[contains(@class, "td-animation-stack")]/div[@class="item-details"]/h3/a'
-                ):
-                    if topic.text and topic.get("href"):
-                        resultList.append(
-                            self.create_article(topic.text.strip(), topic.get("href"))
-                        )
-
-        except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
 
-        return resultList
+class SingTaoToronto(SingTaoBase):
 
+    _edition = "toronto"
 
-class SingTaoToronto(BaseSource):
     def get_id(self):
         return "singtaotoronto"
 
     def get_desc(self):
         return "星島日報(多倫多)"
 
-    def get_articles(self):
-        resultList = []
-        sections = [
+    def get_sections(self):
+        return [
             (
                 "要聞",
                 "https://www.singtao.ca/category/52-%E5%A4%9A%E5%80%AB%E5%A4%9A%E8%A6%81%E8%81%9E/?variant=zh-hk",
@@ -304,57 +320,19 @@ class SingTaoToronto(BaseSource):
             ),
         ]
 
-        try:
-            for (title, url) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then parse the page and extract article links
-                doc = html.document_fromstring(
-                    read_http_page(url, {"edition": "toronto"}).decode("utf-8")
-                )
-
-                # top story
-                top_story_link = doc.xpath(
-                    '(//div[@class="td-ss-main-content"])[1]/div[@class="cat-header-image"]/a'
-                )
-                top_story_text = doc.xpath(
-                    '(//div[@class="td-ss-main-content"])[1]/div[@class="cat-header-image"]/a/div/h3'
-                )
-                if top_story_link and top_story_text:
-                    resultList.append(
-                        self.create_article(
-                            top_story_text[0].text.strip(),
-                            top_story_link[0].get("href"),
-                        )
-                    )
-
-                for topic in doc.xpath(
-                    '(//div[@class="td-ss-main-content"])[1]/div[contains(@class, "td-animation-stack")]/div[@class="item-details"]/h3/a'
-                ):
-                    if topic.text and topic.get("href"):
-                        resultList.append(
-                            self.create_article(topic.text.strip(), topic.get("href"))
-                        )
 
-        except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
-
-        return resultList
+class SingTaoCalgary(SingTaoBase):
 
+    _edition = "calgary"
 
-class SingTaoCalgary(BaseSource):
     def get_id(self):
         return "singtaocalgary"
 
     def get_desc(self):
         return "星島日報(卡加利)"
 
-    def get_articles(self):
-        resultList = []
-        sections = [
+    def get_sections(self):
+        return [
             (
                 "要聞",
                 "https://www.singtao.ca/category/52-%E5%8D%A1%E5%8A%A0%E5%88%A9%E8%A6%81%E8%81%9E/?variant=zh-hk",
@@ -397,57 +375,25 @@ class SingTaoCalgary(BaseSource):
             ),
         ]
 
-        try:
-            for (title, url) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then parse the page and extract article links
-                doc = html.document_fromstring(
-                    read_http_page(url, {"edition": "calgary"}).decode("utf-8")
-                )
-
-                # top story
-                top_story_link = doc.xpath(
-                    '(//div[@class="td-ss-main-content"])[1]/div[@class="cat-header-image"]/a'
-                )
-                top_story_text = doc.xpath(
-                    '(//div[@class="td-ss-main-content"])[1]/div[@class="cat-header-image"]/a/div/h3'
-                )
-                if top_story_link and top_story_text:
-                    resultList.append(
-                        self.create_article(
-                            top_story_text[0].text.strip(),
-                            top_story_link[0].get("href"),
-                        )
-                    )
-
-                for topic in doc.xpath(
-                    '(//div[@class="td-ss-main-content"])[1]/div[contains(@class, "td-animation-stack")]/div[@class="item-details"]/h3/a'
-                ):
-                    if topic.text and topic.get("href"):
-                        resultList.append(
-                            self.create_article(topic.text.strip(), topic.get("href"))
-                        )
-
-        except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
 
-        return resultList
+class TheProvince(AtomBase):
 
+    _entries = etree.XPath(
+        '//atom:entry[@Status="FREE"]', namespaces={"atom": ATOM_NAMESPACE}
+    )
+    # the section queries link to the html page, the atom feeds to xml
+    link_types = ("text/html", "text/xml")
+    link_base = "http://www.theprovince.com"
+    abstract_attribute = "Abstract"
 
-class TheProvince(BaseSource):
     def get_id(self):
         return "theprovince"
 
     def get_desc(self):
         return "The Province"
 
-    def get_articles(self):
-        resultList = []
-        sections = [
+    def get_rss_links(self):
+        return [
             (
                 "Vancouver",
                 "http://www.theprovince.com/scripts/Sp6Query.aspx?catalog=VAPR&tags=category|news|subcategory|metro%20vancouver",
@@ -460,77 +406,10 @@ class TheProvince(BaseSource):
                 "B.C.",
                 "http://www.theprovince.com/scripts/Sp6Query.aspx?catalog=VAPR&tags=category|news|subcategory|b.c.",
             ),
-        ]
-        relSections = [
             ("Canada", "http://www.theprovince.com/7588609.atom"),
             ("World", "http://www.theprovince.com/7589147.atom"),
         ]
 
-        try:
-            for (title, url) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then parse the page and extract article links
-                doc = etree.fromstring(read_http_page(url))
-                for entry in doc.xpath(
-                    '//ns:entry[@Status="FREE"]',
-                    namespaces={"ns": "http://www.w3.org/2005/Atom"},
-                ):
-                    title = entry.xpath(
-                        'ns:title[@type="html"]',
-                        namespaces={"ns": "http://www.w3.org/2005/Atom"},
-                    )[0].text
-                    link = (
-                        "http://www.theprovince.com"
-                        + entry.xpath(
-                            'ns:link[@type="text/html"]',
-                            namespaces={"ns": "http://www.w3.org/2005/Atom"},
-                        )[0].get("href")
-                    )
-                    abstract = entry.xpath(
-                        'ns:link[@type="text/html"]',
-                        namespaces={"ns": "http://www.w3.org/2005/Atom"},
-                    )[0].get("Abstract")
-                    resultList.append(
-                        self.create_article(title.strip(), link, abstract)
-                    )
-
-            for (title, url) in relSections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then parse the page and extract article links
-                doc = etree.fromstring(read_http_page(url))
-                for entry in doc.xpath(
-                    '//ns:entry[@Status="FREE"]',
-                    namespaces={"ns": "http://www.w3.org/2005/Atom"},
-                ):
-                    title = entry.xpath(
-                        'ns:title[@type="html"]',
-                        namespaces={"ns": "http://www.w3.org/2005/Atom"},
-                    )[0].text
-                    link = (
-                        "http://www.theprovince.com"
-                        + entry.xpath(
-                            'ns:link[@type="text/xml"]',
-                            namespaces={"ns": "http://www.w3.org/2005/Atom"},
-                        )[0].get("href")
-                    )
-                    abstract = entry.xpath(
-                        'ns:link[@type="text/xml"]',
-                        namespaces={"ns": "http://www.w3.org/2005/Atom"},
-                    )[0].get("Abstract")
-                    resultList.append(
-                        self.create_article(title.strip(), link, abstract)
-                    )
-
-        except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
-
-        return resultList
-
 
 class VancouverSun(RSSBase):
     def get_id(self):
@@ -567,120 +446,30 @@ class CBCNews(RSSBase):
         ]
 
 
-class MingPaoToronto(BaseSource):
+class MingPaoToronto(MingPaoCanadaBase):
+
+    _edition_path = "TOR"
+    _edition_date = _toronto_edition
+
     def get_id(self):
         return "mingpaotoronto"
 
     def get_desc(self):
         return "明報加東版(多倫多)"
 
-    def get_articles(self):
-        # get date first
-        dateUrl = "http://www.mingpaocanada.com/TOR/"
-        tor_time = datetime.now(pytz.timezone("America/Toronto"))
-        if tor_time.hour < 4:
-            tor_time = tor_time - timedelta(days=1)
-        theDate = tor_time.strftime("%Y%m%d")
-
-        try:
-            doc = html.document_fromstring(read_http_page(dateUrl))
-            for aLink in doc.get_element_by_id("mp-menu").xpath("//div/ul/li/a"):
-                if aLink.text_content() == u"明報首頁":
-                    href = aLink.attrib["href"]
-                    match = re.match(r"htm\/News\/([0-9]{8})\/main_r\.htm", href)
-                    if match and match.lastindex == 1:
-                        theDate = match.group(1)
-                    else:
-                        logger.info("no date found. using system date: " + theDate)
-        except Exception as e:
-            logger.exception("Problem getting date: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
-
-        resultList = []
-        sections = [
-            (
-                "要聞",
-                "http://www.mingpaocanada.com/TOR/htm/News/"
-                + theDate
-                + "/TAindex_r.htm",
-            ),
-            (
-                "加國新聞",
-                "http://www.mingpaocanada.com/TOR/htm/News/"
-                + theDate
-                + "/TDindex_r.htm",
-            ),
-            (
-                "中國",
-                "http://www.mingpaocanada.com/TOR/htm/News/"
-                + theDate
-                + "/TCAindex_r.htm",
-            ),
-            (
-                "國際",
-                "http://www.mingpaocanada.com/TOR/htm/News/"
-                + theDate
-                + "/TTAindex_r.htm",
-            ),
-            (
-                "港聞",
-                "http://www.mingpaocanada.com/TOR/htm/News/"
-                + theDate
-                + "/HK-GAindex_r.htm",
-            ),
-            (
-                "經濟",
-                "http://www.mingpaocanada.com/TOR/htm/News/"
-                + theDate
-                + "/THindex_r.htm",
-            ),
-            (
-                "體育",
-                "http://www.mingpaocanada.com/TOR/htm/News/"
-                + theDate
-                + "/TSindex_r.htm",
-            ),
-            (
-                "影視",
-                "http://www.mingpaocanada.com/TOR/htm/News/"
-                + theDate
-                + "/HK-MAindex_r.htm",
-            ),
-            (
-                "副刊",
-                "http://www.mingpaocanada.com/TOR/htm/News/"
-                + theDate
-                + "/WWindex_r.htm",
-            ),
+    def get_sections(self):
+        return [
+            ("要聞", "TAindex_r.htm"),
+            ("加國新聞", "TDindex_r.htm"),
+            ("中國", "TCAindex_r.htm"),
+            ("國際", "TTAindex_r.htm"),
+            ("港聞", "HK-GAindex_r.htm"),
+            ("經濟", "THindex_r.htm"),
+            ("體育", "TSindex_r.htm"),
+            ("影視", "HK-MAindex_r.htm"),
+            ("副刊", "WWindex_r.htm"),
         ]
 
-        baseUrl = "http://www.mingpaocanada.com/TOR/htm/News/" + theDate + "/"
-        try:
-            for (title, url) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then parse the page and extract article links
-                doc = html.document_fromstring(
-                    read_http_page(url).decode("big5-hkscs", errors="ignore")
-                )
-                for topic in doc.xpath('//h4[contains(@class, "listing-link")]/a'):
-                    if topic.text and topic.get("href"):
-                        resultList.append(
-                            self.create_article(
-                                topic.text.strip(), baseUrl + topic.get("href")
-                            )
-                        )
-
-        except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
-
-        return resultList
-
 
 class TorontoStar(RSSBase):
     def get_id(self):
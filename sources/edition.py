@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Date of the current edition of a daily paper, as linked from its home page.
+# The date found is kept until the next edition is due (cutoff_hour in the
+# paper's timezone). Until then, retries (e.g. while the new edition isn't
+# out yet) happen in a background thread with the known date returned
+# meanwhile. The first request, and the first after each rollover, wait for
+# the home page; concurrent ones share a single fetch.
+
+import time
+import threading
+import contextvars
+from datetime import datetime, timedelta
+import pytz
+
+from logger import logger
+from fetcher import read_html_page
+import metrics
+
+# new editions are expected at this hour, local time
+CUTOFF_HOUR = 4
+# seconds before asking again when the home page failed or still links to
+# the previous edition
+RETRY_INTERVAL = 10 * 60
+
+
+class EditionDate:
+    def __init__(self, url, find_date, timezone, cutoff_hour=CUTOFF_HOUR):
+        # find_date(doc) returns the date ("%Y%m%d") linked from the page
+        self.url = url
+        self.find_date = find_date
+        self.timezone = pytz.timezone(timezone)
+        self.cutoff_hour = cutoff_hour
+        self._lock = threading.Lock()
+        # held while the home page is fetched
+        self._resolve_lock = threading.Lock()
+        self._date = None
+        self._expires = 0
+        # the next edition is due then; the date is no longer served after it
+        self._rollover = 0
+        self._refreshing = False
+
+    def _local_now(self):
+        return datetime.now(self.timezone)
+
+    def expected(self):
+        # date of the edition that should be out by now
+        local_time = self._local_now()
+        if local_time.hour < self.cutoff_hour:
+            local_time = local_time - timedelta(days=1)
+        return local_time.strftime("%Y%m%d")
+
+    def _next_rollover(self):
+        local_time = self._local_now()
+        rollover = local_time.replace(
+            hour=self.cutoff_hour, minute=0, second=0, microsecond=0
+        )
+        if rollover <= local_time:
+            rollover = rollover + timedelta(days=1)
+        rollover = self.timezone.normalize(
+            self.timezone.localize(rollover.replace(tzinfo=None))
+        )
+        return rollover.timestamp()
+
+    def _resolve(self):
+        # callers hold _resolve_lock
+        expected = self.expected()
+        date = None
+        try:
+            doc = read_html_page(self.url)
+            if doc is not None:
+                date = self.find_date(doc)
+                if not date:
+                    logger.info("no date found. using system date: " + expected)
+        except Exception as e:
+            logger.exception("Problem getting date", e)
+
+        now = time.time()
+        rollover = self._next_rollover()
+        if date and date >= expected:
+            expires = rollover
+        else:
+            # not out yet, or couldn't tell. Ask again soon
+            date = date or expected
+            expires = min(now + RETRY_INTERVAL, rollover)
+
+        with self._lock:
+            self._date = date
+            self._expires = expires
+            self._rollover = rollover
+        return date
+
+    def _refresh(self):
+        try:
+            with self._resolve_lock:
+                self._resolve()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self):
+        now = time.time()
+        with self._lock:
+            date = self._date
+            fresh = date is not None and now < self._expires
+            # past the rollover the date is the previous edition's; wait for
+            # the new one rather than serve it
+            due = date is None or now >= self._rollover
+            refresh = not fresh and not due and not self._refreshing
+            if refresh:
+                self._refreshing = True
+        metrics.record_cache("edition_date", fresh)
+
+        if due:
+            # one caller fetches the home page, the others wait for its result
+            with self._resolve_lock:
+                with self._lock:
+                    if self._date is not None and time.time() < self._rollover:
+                        return self._date
+                return self._resolve()
+        if refresh:
+            # in the caller's context, so logs and metrics name the source
+            threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(self._refresh,),
+                name="edition-date",
+                daemon=True,
+            ).start()
+        return date
@@ -21,56 +21,41 @@
 # SOFTWARE.
 
 import re
-from datetime import datetime, timedelta
-from lxml import html
-import traceback
-import json
-import urllib
 from urllib.parse import urlparse
-import pytz
 
 from logger import logger
-from fetcher import read_http_page
+from fetcher import read_html_page
+from dedup import DedupIndex
+from context import section_scope
 
 from .base import BaseSource
 from .base import RSSBase
+from .base import FusionBase
+from .pagination import paginate
+from .edition import EditionDate
 
 
-class AppleDaily(BaseSource):
-    _base_url = "https://hk.news.appledaily.com"
-
-    def _find_date_id(self, raw_page):
-        m_d = re.search(r"Fusion\.deployment\=\"([0-9]+)\"", str(raw_page))
+def _find_oriental_date(doc):
+    date = None
+    for aLink in doc.get_element_by_id("topMenu").xpath(
+        'ul[contains(@class, "menuList clear")]/li/a[contains(@class, "news")]'
+    ):
+        match = re.match(r"\/cnt\/news\/([0-9]{8})\/index\.html", aLink.attrib["href"])
+        if match and match.lastindex == 1:
+            # the last link wins, as it always did
+            date = match.group(1)
+    return date
 
-        hk_time = datetime.now(pytz.timezone("Hongkong"))
-        if hk_time.hour < 4:
-            hk_time = hk_time - timedelta(days=1)
-        result_date = hk_time.strftime("%Y%m%d")
 
-        result_d = 0
-        if m_d:
-            result_d = m_d.group(1)
+# the paper's date, no early morning cutoff
+_oriental_edition = EditionDate(
+    "http://orientaldaily.on.cc/", _find_oriental_date, "Hongkong", cutoff_hour=0
+)
 
-        return result_date, result_d
 
-    def _get_collection(self, section_id, date_id, d):
-        payload_query = {
-            "feedOffset": 0,
-            "feedQuery": 'taxonomy.primary_section._id:"{}" AND type:story AND editor_note:"{}"'.format(
-                section_id, date_id
-            ),
-            "feedSize": 100,
-            "sort": "location:asc",
-        }
-        payload_query = urllib.parse.quote(json.dumps(payload_query))
-
-        query_url = (
-            self._base_url
-            + "/pf/api/v3/content/fetch/query-feed?query={}&d={}&_website=hk-appledaily".format(
-                payload_query, d
-            )
-        )
-        return read_http_page(query_url)
+class AppleDaily(FusionBase):
+    _base_url = "https://hk.news.appledaily.com"
+    _website = "hk-appledaily"
 
     def get_id(self):
         return "appledaily"
@@ -78,52 +63,16 @@ class AppleDaily(BaseSource):
     def get_desc(self):
         return "蘋果日報(香港)"
 
-    def get_articles(self):
-        resultList = []
-        sections = [
-            ("要聞港聞", "/daily/local", self._base_url + "/daily/local/"),
-            ("兩岸", "/daily/china", self._base_url + "/daily/china/"),
-            ("國際", "/daily/international", self._base_url + "/daily/international/"),
-            ("財經", "/daily/finance", self._base_url + "/daily/finance/"),
-            ("娛樂", "/daily/entertainment", self._base_url + "/daily/entertainment/"),
-            ("體育", "/daily/sports", self._base_url + "/daily/sports/"),
+    def get_sections(self):
+        return [
+            ("要聞港聞", "/daily/local"),
+            ("兩岸", "/daily/china"),
+            ("國際", "/daily/international"),
+            ("財經", "/daily/finance"),
+            ("娛樂", "/daily/entertainment"),
+            ("體育", "/daily/sports"),
         ]
 
-        try:
-            for (title, section_id, url) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then retrieve the json content
-                raw_page = read_http_page(url)
-                date_id, d = self._find_date_id(raw_page)
-                if date_id and d:
-                    raw_result = self._get_collection(section_id, date_id, d)
-                    result = json.loads(raw_result)
-                    for article in result["content_elements"]:
-                        desc = article["headlines"]["basic"]
-                        href = article["website_url"]
-                        abstract = None
-                        if (
-                            "content_elements" in article
-                            and len(article["content_elements"]) > 1
-                            and "content" in article["content_elements"][0]
-                        ):
-                            abstract = article["content_elements"][0]["content"]
-                        if desc and href:
-                            resultList.append(
-                                self.create_article(
-                                    desc.strip(), self._base_url + href, abstract
-                                )
-                            )
-
-        except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
-
-        return resultList
-
 
 class MingPaoHK(RSSBase):
     def get_id(self):
@@ -173,28 +122,10 @@ class OrientalDaily(BaseSource):
         return "東方日報(香港)"
 
     def get_articles(self):
-        # get date first
-        dateUrl = "http://orientaldaily.on.cc/"
-        theDate = datetime.today().strftime("%Y%m%d")
-        try:
-            doc = html.document_fromstring(read_http_page(dateUrl))
-            for aLink in doc.get_element_by_id("topMenu").xpath(
-                'ul[contains(@class, "menuList clear")]/li/a[contains(@class, "news")]'
-            ):
-                href = aLink.attrib["href"]
-                match = re.match(r"\/cnt\/news\/([0-9]{8})\/index\.html", href)
-                if match and match.lastindex == 1:
-                    theDate = match.group(1)
-                else:
-                    logger.info("no date found. using system date: " + theDate)
-        except Exception as e:
-            logger.exception("Problem getting date: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
+        theDate = _oriental_edition.get()
 
         resultList = []
-        baseUrl = dateUrl
+        baseUrl = "http://orientaldaily.on.cc/"
 
         sections = [
             ("要聞港聞", "http://orientaldaily.on.cc/cnt/news/" + theDate + "/index.html"),
@@ -213,37 +144,60 @@ class OrientalDaily(BaseSource):
 
         try:
             for (title, url) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then parse the page and extract article links
-                doc = html.document_fromstring(read_http_page(url))
-                if doc is not None and doc.get_element_by_id("articleList") is not None:
-                    for topic in doc.get_element_by_id("articleList").xpath(
-                        'ul[contains(@class, "commonBigList")]/li/a'
+                with section_scope(title):
+                    # for each section, insert a title...
+                    resultList.append(self.create_section(title))
+                    # ... then parse the page and extract article links
+                    doc = read_html_page(url)
+                    if (
+                        doc is not None
+                        and doc.get_element_by_id("articleList") is not None
                     ):
-                        if topic.text and topic.get("href"):
-                            resultList.append(
-                                self.create_article(
-                                    topic.text.strip(), baseUrl + topic.get("href")
+                        for topic in doc.get_element_by_id("articleList").xpath(
+                            'ul[contains(@class, "commonBigList")]/li/a'
+                        ):
+                            if topic.text and topic.get("href"):
+                                resultList.append(
+                                    self.create_article(
+                                        topic.text.strip(), baseUrl + topic.get("href")
+                                    )
                                 )
-                            )
 
         except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
+            logger.exception("Problem processing url", e)
 
         return resultList
 
 
 class SingPao(BaseSource):
+    _base_url = "http://www.singpao.com.hk/"
+
     def get_id(self):
         return "singpao"
 
     def get_desc(self):
         return "香港成報"
 
+    def _page_count(self, doc):
+        maxPage = 1
+        for pageIndex in doc.xpath('//a[contains(@class, "fpagelist_css")]'):
+            if pageIndex.text is not None:
+                match = re.match(r"^([0-9]+)$", pageIndex.text.strip())
+                if match and match.lastindex == 1 and int(match.group(1)) > maxPage:
+                    maxPage = int(match.group(1))
+        return maxPage
+
+    def _extract(self, doc):
+        articles = []
+        for topic in doc.xpath('//td/a[contains(@class, "list_title")]'):
+            if topic.text and topic.get("href"):
+                articles.append(
+                    self.create_article(
+                        topic.text.strip(), self._base_url + topic.get("href")
+                    )
+                )
+        return articles
+
     def get_articles(self):
         maxPagePerSection = 10
         resultList = []
@@ -256,46 +210,26 @@ class SingPao(BaseSource):
             ("體育", "http://www.singpao.com.hk/index.php?fi=news5"),
             ("副刊", "http://www.singpao.com.hk/index.php?fi=news7"),
         ]
-        baseUrl = "http://www.singpao.com.hk/"
 
         try:
             for (title, url) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then parse the page and extract article links
-                page = 1
-                maxPage = 1
-                while page <= maxPage and page <= maxPagePerSection:
-                    doc = html.document_fromstring(
-                        read_http_page(url + "&page=" + str(page))
+                with section_scope(title):
+                    # for each section, insert a title...
+                    resultList.append(self.create_section(title))
+                    # ... then read the page count from the first page and get
+                    # the other pages with anything new
+                    resultList.extend(
+                        paginate(
+                            lambda page: read_html_page(url + "&page=" + str(page)),
+                            self._extract,
+                            maxPagePerSection,
+                            self._page_count,
+                            key=url,
+                        )
                     )
-                    page += 1
-
-                    for topic in doc.xpath('//td/a[contains(@class, "list_title")]'):
-                        if topic.text and topic.get("href"):
-                            resultList.append(
-                                self.create_article(
-                                    topic.text.strip(), baseUrl + topic.get("href")
-                                )
-                            )
-
-                    for pageIndex in doc.xpath(
-                        '//a[contains(@class, "fpagelist_css")]'
-                    ):
-                        if pageIndex.text is not None:
-                            match = re.match(r"^([0-9]+)$", pageIndex.text.strip())
-                            if (
-                                match
-                                and match.lastindex == 1
-                                and int(match.group(1)) > maxPage
-                            ):
-                                maxPage = int(match.group(1))
 
         except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
+            logger.exception("Problem processing url", e)
 
         return resultList
 
@@ -337,33 +271,31 @@ class TaKungPao(BaseSource):
 
         try:
             for (title, url) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then parse the page and extract article links
-                doc = html.document_fromstring(read_http_page(url))
-
-                for topic in doc.xpath(
-                    '//div[contains(@class, "list_tuwen")]/div[contains(@class, "content")]'
-                ):
-                    title = topic.xpath('ul/li[contains(@class, "title")]/a')
-                    intro = topic.xpath('ul/li[contains(@class, "intro")]/a')
-
-                    if title and title[0].text and title[0].get("href"):
-                        resultList.append(
-                            self.create_article(
-                                title[0].text.strip(),
-                                title[0].get("href"),
-                                intro[0].text.strip()
-                                if intro and intro[0].text
-                                else None,
+                with section_scope(title):
+                    # for each section, insert a title...
+                    resultList.append(self.create_section(title))
+                    # ... then parse the page and extract article links
+                    doc = read_html_page(url)
+
+                    for topic in doc.xpath(
+                        '//div[contains(@class, "list_tuwen")]/div[contains(@class, "content")]'
+                    ):
+                        title = topic.xpath('ul/li[contains(@class, "title")]/a')
+                        intro = topic.xpath('ul/li[contains(@class, "intro")]/a')
+
+                        if title and title[0].text and title[0].get("href"):
+                            resultList.append(
+                                self.create_article(
+                                    title[0].text.strip(),
+                                    title[0].get("href"),
+                                    intro[0].text.strip()
+                                    if intro and intro[0].text
+                                    else None,
+                                )
                             )
-                        )
 
         except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
+            logger.exception("Problem processing url", e)
 
         return resultList
 
@@ -412,6 +344,20 @@ class HkEt(BaseSource):
     def get_desc(self):
         return "香港經濟日報"
 
+    def _extract(self, doc, base_url):
+        articles = []
+        for topic in doc.xpath(
+            '//div[contains(@class, "listing-widget-33") or contains(@class, "listing-widget-4") or contains(@class, "listing-widget-9")]/a[contains(@class, "listing-overlay")]'
+        ):
+            if topic.text and topic.get("href"):
+                topic_url = (
+                    topic.get("href")
+                    if self._is_absolute(topic.get("href"))
+                    else base_url + topic.get("href")
+                )
+                articles.append(self.create_article(topic.text.strip(), topic_url))
+        return articles
+
     def get_articles(self):
         resultList = []
         sections = [
@@ -422,36 +368,26 @@ class HkEt(BaseSource):
             ("國際", "https://inews.hket.com", "/sran011/國際", 2),
             ("商業", "https://inews.hket.com", "/sran012/商業", 2),
         ]
-        seen_url = {}
+        seen_url = DedupIndex(by_title=False)
 
         try:
             for (title, base_url, url, pages) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then get page and parse
-                for page in range(1, pages + 1):
-                    doc = html.document_fromstring(
-                        read_http_page(base_url + url + "?p={}".format(page))
-                    )
-                    for topic in doc.xpath(
-                        '//div[contains(@class, "listing-widget-33") or contains(@class, "listing-widget-4") or contains(@class, "listing-widget-9")]/a[contains(@class, "listing-overlay")]'
+                with section_scope(title):
+                    # for each section, insert a title...
+                    resultList.append(self.create_section(title))
+                    # ... then get the pages with anything new and parse
+                    for article in paginate(
+                        lambda page: read_html_page(
+                            base_url + url + "?p={}".format(page)
+                        ),
+                        lambda doc: self._extract(doc, base_url),
+                        pages,
+                        key=base_url + url,
                     ):
-                        if topic.text and topic.get("href"):
-                            topic_url = (
-                                topic.get("href")
-                                if self._is_absolute(topic.get("href"))
-                                else base_url + topic.get("href")
-                            )
-                            if topic_url not in seen_url:
-                                seen_url[topic_url] = None
-                                resultList.append(
-                                    self.create_article(topic.text.strip(), topic_url)
-                                )
+                        if seen_url.add(article):
+                            resultList.append(article)
 
         except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
+            logger.exception("Problem processing url", e)
 
         return resultList
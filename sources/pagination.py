@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Fetching the pages of a section listing spread over several pages. Pages
+# are downloaded concurrently (the fetcher keeps to its per-host connection
+# limit) and their articles returned in page order.
+#
+# With a key, pagination is incremental: the articles of the section are kept
+# from one refresh to the next, and paging stops at the first page that has
+# nothing new. The pages not downloaded are filled in from the previous
+# refresh, so in the steady state a section costs one request. Every
+# SNAPSHOT_MAX_AGE seconds all pages are fetched again.
+
+import time
+
+from context import run_concurrently
+from cache import TTLCache
+
+SNAPSHOT_MAX_AGE = 60 * 60
+
+# key -> (time of the last full fetch + SNAPSHOT_MAX_AGE, articles)
+_snapshots = TTLCache("pagination_snapshot", SNAPSHOT_MAX_AGE, maxsize=1024)
+
+
+def _fetch_all(fetch_articles, fetch, extract, max_pages, page_count):
+    if page_count is None:
+        return run_concurrently(fetch_articles, range(1, max_pages + 1))
+
+    first = fetch(1)
+    if first is None:
+        return []
+    last = min(page_count(first), max_pages)
+    return [extract(first)] + run_concurrently(fetch_articles, range(2, last + 1))
+
+
+def _fetch_new(fetch, extract, max_pages, page_count, known):
+    # pages one after the other, up to the first without a new article
+    pages = []
+    last = max_pages
+    page = 1
+    while page <= last:
+        doc = fetch(page)
+        if doc is None:
+            break
+        if page == 1 and page_count is not None:
+            last = min(page_count(doc), max_pages)
+        articles = extract(doc)
+        pages.append(articles)
+        if all(a.get("url") in known for a in articles):
+            break
+        page += 1
+    return pages
+
+
+def paginate(fetch, extract, max_pages, page_count=None, key=None):
+    # fetch(n) returns page n (1 based) or None, extract(page) its articles.
+    # With page_count, page 1 is fetched first and page_count(page 1) tells
+    # how many pages the section has; otherwise max_pages are fetched.
+    # key (e.g. the section url) turns on incremental pagination
+    def fetch_articles(n):
+        page = fetch(n)
+        return extract(page) if page is not None else []
+
+    snapshot = _snapshots.get(key) if key is not None else None
+    if snapshot is None:
+        pages = _fetch_all(fetch_articles, fetch, extract, max_pages, page_count)
+        articles = [article for articles in pages for article in articles]
+        expires = time.monotonic() + SNAPSHOT_MAX_AGE
+    else:
+        (expires, previous) = snapshot
+        known = {a.get("url") for a in previous}
+        pages = _fetch_new(fetch, extract, max_pages, page_count, known)
+        articles = [article for articles in pages for article in articles]
+        if not pages:
+            # upstream failed; better the last known list than nothing
+            articles = previous
+        else:
+            # older articles from the pages not fetched this time, as long
+            # as the section doesn't grow beyond its previous length
+            fetched = {a.get("url") for a in articles}
+            older = [a for a in previous if a.get("url") not in fetched]
+            articles += older[: max(len(previous) - len(articles), 0)]
+        articles = [dict(a) for a in articles]
+
+    if key is not None and articles:
+        # copies, as the pipeline edits the articles it is handed
+        _snapshots.set(
+            key,
+            (expires, [dict(a) for a in articles]),
+            ttl=max(expires - time.monotonic(), 0),
+        )
+    return articles
@@ -20,21 +20,17 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import re
-from datetime import datetime, timedelta
-from lxml import html
-import json
-import urllib
-from urllib.parse import urlparse
-import traceback
-import pytz
-
 from logger import logger
-from fetcher import read_http_page
+from fetcher import read_http_page, read_html_page
+from metrics import parse_timer
+import jsoncodec
+from context import section_scope
 
 from .base import BaseSource
 from .base import RSSBase
 from .base import RDFBase
+from .base import FusionBase
+from .pagination import paginate
 
 
 class LibertyTimes(BaseSource):
@@ -44,6 +40,25 @@ class LibertyTimes(BaseSource):
     def get_desc(self):
         return "自由時報"
 
+    def _fetch(self, url):
+        raw_result = read_http_page(url)
+        if raw_result is None:
+            return None
+        with parse_timer("json"):
+            return jsoncodec.loads(raw_result)
+
+    def _extract(self, result):
+        articles = []
+        if result.get("code", 0) == 200:
+            data = result.get("data", [])
+            for item in data.values() if isinstance(data, dict) else data:
+                title = item.get("title", None)
+                url = item.get("url", None)
+                abstract = item.get("summary", None)
+                if title and url:
+                    articles.append(self.create_article(title, url, abstract))
+        return articles
+
     def get_articles(self):
         num_pages = 2
         baseUrl = "https://news.ltn.com.tw"
@@ -59,29 +74,22 @@ class LibertyTimes(BaseSource):
         ]
 
         try:
-            for page in range(1, num_pages):
-                for (title, url) in sections:
-                    url = url + str(page)
+            for (title, url) in sections:
+                with section_scope(title):
                     # for each section, insert a title...
                     resultList.append(self.create_section(title))
-                    # ... then parse the page and extract article links
-                    result = json.loads(read_http_page(url + str(page)).decode("UTF-8"))
-                    if result.get("code", 0) == 200:
-                        data = result.get("data", [])
-                        for key in data.keys():
-                            title = data[key].get("title", None)
-                            url = data[key].get("url", None)
-                            abstract = data[key].get("summary", None)
-                            if title and url:
-                                resultList.append(
-                                    self.create_article(title, url, abstract)
-                                )
+                    # ... then parse the pages with anything new and extract article links
+                    resultList.extend(
+                        paginate(
+                            lambda page: self._fetch(url + str(page)),
+                            self._extract,
+                            num_pages,
+                            key=url,
+                        )
+                    )
 
         except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
+            logger.exception("Problem processing url", e)
 
         return resultList
 
@@ -111,13 +119,10 @@ class UnitedDailyNewsRSS(RSSBase):
 
 
 class MoneyUnitedDailyNewsRSS(RSSBase):
-    @staticmethod
-    def is_url(url):
-        try:
-            result = urlparse(url)
-            return all([result.scheme, result.netloc])
-        except ValueError:
-            return False
+
+    # the feeds are listed on this page, see RSSBase
+    feed_list_url = "https://money.udn.com/rssfeed/lists/1001"
+    feed_list_xpath = '//*[@id="rss_list"]/div/div/dl/dt/a'
 
     def get_id(self):
         return "money-udn"
@@ -125,60 +130,11 @@ class MoneyUnitedDailyNewsRSS(RSSBase):
     def get_desc(self):
         return "經濟日報-聯合新聞網"
 
-    def get_rss_links(self):
-        resultList = []
-        try:
-            rss_list_url = "https://money.udn.com/rssfeed/lists/1001"
-            doc = html.document_fromstring(read_http_page(rss_list_url))
-            for aLink in doc.get_element_by_id("rss_list").xpath("div/div/dl/dt/a"):
-                if aLink.xpath("text()") and MoneyUnitedDailyNewsRSS.is_url(
-                    aLink.get("href")
-                ):
-                    resultList.append((aLink.xpath("text()"), aLink.get("href")))
-        except Exception as e:
-            logger.exception("Problem fetching rss links: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
 
-        return resultList
-
-
-class AppleDailyTaiwan(BaseSource):
+class AppleDailyTaiwan(FusionBase):
     _base_url = "https://tw.appledaily.com"
-
-    def _find_date_id(self, raw_page):
-        m_d = re.search(r"Fusion\.deployment\=\"([0-9]+)\"", str(raw_page))
-
-        tw_time = datetime.now(pytz.timezone("Hongkong"))  # same tz as hk
-        if tw_time.hour < 4:
-            tw_time = tw_time - timedelta(days=1)
-        result_date = tw_time.strftime("%Y%m%d")
-
-        result_d = 0
-        if m_d:
-            result_d = m_d.group(1)
-
-        return result_date, result_d
-
-    def _get_collection(self, section_id, date_id, d):
-        payload_query = {
-            "feedOffset": 0,
-            "feedQuery": 'taxonomy.primary_section._id:"{}" AND type:story AND editor_note:"{}"'.format(
-                section_id, date_id
-            ),
-            "feedSize": 100,
-            "sort": "location:asc",
-        }
-        payload_query = urllib.parse.quote(json.dumps(payload_query))
-
-        query_url = (
-            self._base_url
-            + "/pf/api/v3/content/fetch/query-feed?query={}&d={}&_website=hk-appledaily".format(
-                payload_query, d
-            )
-        )
-        return read_http_page(query_url)
+    _website = "hk-appledaily"
+    _timezone = "Hongkong"  # same tz as hk
 
     def get_id(self):
         return "appledailytw"
@@ -186,53 +142,17 @@ class AppleDailyTaiwan(BaseSource):
     def get_desc(self):
         return "蘋果日報(台灣)"
 
-    def get_articles(self):
-        resultList = []
-        sections = [
-            ("要聞", "/daily/headline", self._base_url + "/daily/headline/"),
-            ("娛樂", "/daily/entertainment", self._base_url + "/daily/entertainment/"),
-            ("國際", "/daily/international", self._base_url + "/daily/international/"),
-            ("財經", "/daily/finance", self._base_url + "/daily/finance/"),
-            ("副刊", "/daily/lifestyle", self._base_url + "/daily/lifestyle/"),
-            ("體育", "/daily/sports", self._base_url + "/daily/sports/"),
-            ("地產", "/daily/home", self._base_url + "/daily/home/"),
+    def get_sections(self):
+        return [
+            ("要聞", "/daily/headline"),
+            ("娛樂", "/daily/entertainment"),
+            ("國際", "/daily/international"),
+            ("財經", "/daily/finance"),
+            ("副刊", "/daily/lifestyle"),
+            ("體育", "/daily/sports"),
+            ("地產", "/daily/home"),
         ]
 
-        try:
-            for (title, section_id, url) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then retrieve the json content
-                raw_page = read_http_page(url)
-                date_id, d = self._find_date_id(raw_page)
-                if date_id and d:
-                    raw_result = self._get_collection(section_id, date_id, d)
-                    result = json.loads(raw_result)
-                    for article in result["content_elements"]:
-                        desc = article["headlines"]["basic"]
-                        href = article["website_url"]
-                        abstract = None
-                        if (
-                            "content_elements" in article
-                            and len(article["content_elements"]) > 1
-                            and "content" in article["content_elements"][0]
-                        ):
-                            abstract = article["content_elements"][0]["content"]
-                        if desc and href:
-                            resultList.append(
-                                self.create_article(
-                                    desc.strip(), self._base_url + href, abstract
-                                )
-                            )
-
-        except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
-
-        return resultList
-
 
 class TaipeiTimes(RDFBase):
     def get_id(self):
@@ -278,23 +198,23 @@ class ChinaTimes(BaseSource):
 
         try:
             for (title, url) in sections:
-                # for each section, insert a title...
-                resultList.append(self.create_section(title))
-                # ... then parse the page and extract article links
-                doc = html.document_fromstring(read_http_page(url))
-                for topic in doc.xpath(
-                    '//section[contains(@class, "article-list")]/ul//li//h3[contains(@class, "title")]//a'
-                ):
-                    if topic.text and topic.get("href"):
-                        resultList.append(
-                            self.create_article(topic.text.strip(), topic.get("href"))
-                        )
+                with section_scope(title):
+                    # for each section, insert a title...
+                    resultList.append(self.create_section(title))
+                    # ... then parse the page and extract article links
+                    doc = read_html_page(url)
+                    for topic in doc.xpath(
+                        '//section[contains(@class, "article-list")]/ul//li//h3[contains(@class, "title")]//a'
+                    ):
+                        if topic.text and topic.get("href"):
+                            resultList.append(
+                                self.create_article(
+                                    topic.text.strip(), topic.get("href")
+                                )
+                            )
 
         except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
+            logger.exception("Problem processing url", e)
 
         return resultList
 
@@ -319,6 +239,52 @@ class Storm(BaseSource):
     def get_desc(self):
         return "風傳媒"
 
+    def _extract(self, doc):
+        articles = []
+
+        # get the first featured article
+        topic = doc.xpath(
+            '//div[contains(@class, "category_top_card")]/div[contains(@class, "card_img_wrapper")]'
+        )
+        if topic:
+            title = topic[0].xpath(
+                'div[contains(@class, "card_inner_wrapper")]/a[contains(@class, "link_title")]'
+            )
+            intro = topic[0].xpath(
+                'div[contains(@class, "card_inner_wrapper")]/a[contains(@class, "card_substance")]'
+            )
+            title_text = title[0].xpath("h2/text()") if title else None
+            if title and title_text and title[0].get("href"):
+                articles.append(
+                    self.create_article(
+                        title_text[0].strip(),
+                        title[0].get("href"),
+                        intro[0].text.strip() if intro and intro[0].text else None,
+                    )
+                )
+
+        for topic in doc.xpath(
+            '//div[contains(@class, "category_cards_wrapper")]/div[contains(@class, "category_card")]'
+        ):
+            title = topic.xpath(
+                'div[contains(@class, "card_inner_wrapper")]/a[contains(@class, "link_title")]'
+            )
+            intro = topic.xpath(
+                'div[contains(@class, "card_inner_wrapper")]/a[contains(@class, "card_substance")]'
+            )
+            title_text = title[0].xpath("h3/text()") if title else None
+
+            if title and title_text and title[0].get("href"):
+                articles.append(
+                    self.create_article(
+                        title_text[0].strip(),
+                        title[0].get("href"),
+                        intro[0].text.strip() if intro and intro[0].text else None,
+                    )
+                )
+
+        return articles
+
     def get_articles(self):
         resultList = []
 
@@ -335,63 +301,20 @@ class Storm(BaseSource):
 
         try:
             for (title, url) in sections:
-                resultList.append(self.create_section(title))
-                for page in range(1, pages + 1):
+                with section_scope(title):
                     # for each section, insert a title...
-                    # ... then parse the page and extract article links
-                    doc = html.document_fromstring(
-                        read_http_page(url + "/" + str(page))
-                    )
-
-                    # get the first featured article
-                    topic = doc.xpath(
-                        '//div[contains(@class, "category_top_card")]/div[contains(@class, "card_img_wrapper")]'
-                    )
-                    if topic:
-                        title = topic[0].xpath(
-                            'div[contains(@class, "card_inner_wrapper")]/a[contains(@class, "link_title")]'
-                        )
-                        intro = topic[0].xpath(
-                            'div[contains(@class, "card_inner_wrapper")]/a[contains(@class, "card_substance")]'
-                        )
-                        title_text = title[0].xpath("h2/text()") if title else None
-                        if title and title_text and title[0].get("href"):
-                            resultList.append(
-                                self.create_article(
-                                    title_text[0].strip(),
-                                    title[0].get("href"),
-                                    intro[0].text.strip()
-                                    if intro and intro[0].text
-                                    else None,
-                                )
-                            )
-
-                    for topic in doc.xpath(
-                        '//div[contains(@class, "category_cards_wrapper")]/div[contains(@class, "category_card")]'
-                    ):
-                        title = topic.xpath(
-                            'div[contains(@class, "card_inner_wrapper")]/a[contains(@class, "link_title")]'
-                        )
-                        intro = topic.xpath(
-                            'div[contains(@class, "card_inner_wrapper")]/a[contains(@class, "card_substance")]'
+                    resultList.append(self.create_section(title))
+                    # ... then parse the pages with anything new and extract article links
+                    resultList.extend(
+                        paginate(
+                            lambda page: read_html_page(url + "/" + str(page)),
+                            self._extract,
+                            pages,
+                            key=url,
                         )
-                        title_text = title[0].xpath("h3/text()") if title else None
-
-                        if title and title_text and title[0].get("href"):
-                            resultList.append(
-                                self.create_article(
-                                    title_text[0].strip(),
-                                    title[0].get("href"),
-                                    intro[0].text.strip()
-                                    if intro and intro[0].text
-                                    else None,
-                                )
-                            )
+                    )
 
         except Exception as e:
-            logger.exception("Problem processing url: " + str(e))
-            logger.exception(
-                traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            )
+            logger.exception("Problem processing url", e)
 
         return resultList
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Startup profiler: where does a cold start of main.py spend its time?
+#
+#   python startup.py [--budget SECONDS] [--sources] [--top N] [--output FILE]
+#
+# main.py is imported in a fresh interpreter under "python -X importtime".
+# The report lists the slowest modules by self and cumulative import time
+# and, with --sources, the import and initialisation time of every source
+# class. With --budget the exit status is 1 when startup takes longer.
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _child(with_sources):
+    # runs in the profiled interpreter; timings go to stdout as json
+    start = time.perf_counter()
+    import main
+
+    result = {"startup": time.perf_counter() - start, "sources": []}
+    if with_sources:
+        import importlib
+
+        for id in main.allSources:
+            entry = main.allSources._entries.get(id)
+            t0 = time.perf_counter()
+            module = entry and importlib.import_module(entry["module"])
+            t1 = time.perf_counter()
+            main.allSources[id]
+            t2 = time.perf_counter()
+            result["sources"].append(
+                {
+                    "id": id,
+                    "module": entry["module"] if entry else "",
+                    "import": t1 - t0 if module else 0,
+                    "init": t2 - t1,
+                }
+            )
+    print(json.dumps(result))
+
+
+def _parse_importtime(lines, root="main"):
+    # "import time: self [us] | cumulative | imported package", one line per
+    # module in the order the imports finish, nesting shown by indentation.
+    # only root and the modules it pulled in are kept
+    entries = []
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        (self_us, cumulative_us, name) = line.split(":", 1)[1].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+
+    modules = []
+    for (i, (depth, name, _, _)) in enumerate(entries):
+        if depth == 0 and name == root:
+            first = i
+            while first > 0 and entries[first - 1][0] > 0:
+                first -= 1
+            last = i + 1
+            for (depth, name, self_us, cumulative_us) in entries[first:last]:
+                modules.append(
+                    {
+                        "module": name,
+                        "depth": depth,
+                        "self": self_us / 1e6,
+                        "cumulative": cumulative_us / 1e6,
+                    }
+                )
+            break
+    return modules
+
+
+def profile(with_sources=False):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", __file__, "--child"]
+        + (["--sources"] if with_sources else []),
+        cwd=HERE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["modules"] = _parse_importtime(proc.stderr.splitlines())
+    return result
+
+
+def report(result, top=25, budget=None):
+    lines = [
+        "startup: {:.1f} ms{}".format(
+            result["startup"] * 1000,
+            " (budget {:.1f} ms)".format(budget * 1000) if budget else "",
+        ),
+        "",
+        "{:<50} {:>10} {:>14}".format("slowest modules", "self ms", "cumulative ms"),
+    ]
+    for m in sorted(result["modules"], key=lambda m: m["self"], reverse=True)[:top]:
+        lines.append(
+            "{:<50} {:>10.1f} {:>14.1f}".format(
+                m["module"], m["self"] * 1000, m["cumulative"] * 1000
+            )
+        )
+
+    lines += [
+        "",
+        "{:<50} {:>10} {:>14}".format("imported by main", "", "cumulative ms"),
+    ]
+    for m in sorted(
+        (m for m in result["modules"] if m["depth"] == 1),
+        key=lambda m: m["cumulative"],
+        reverse=True,
+    )[:top]:
+        lines.append(
+            "{:<50} {:>10} {:>14.1f}".format(m["module"], "", m["cumulative"] * 1000)
+        )
+
+    if result["sources"]:
+        lines += ["", "{:<50} {:>10} {:>14}".format("sources", "import ms", "init ms")]
+        for s in sorted(
+            result["sources"], key=lambda s: s["import"] + s["init"], reverse=True
+        ):
+            lines.append(
+                "{:<50} {:>10.1f} {:>14.1f}".format(
+                    s["id"] + " (" + s["module"] + ")",
+                    s["import"] * 1000,
+                    s["init"] * 1000,
+                )
+            )
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="profile the startup of main.py")
+    parser.add_argument(
+        "--budget", type=float, help="fail if startup takes longer (seconds)"
+    )
+    parser.add_argument("--sources", action="store_true", help="also load every source")
+    parser.add_argument("--top", type=int, default=25, help="modules to list")
+    parser.add_argument("--output", help="write the report to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, HERE)
+        _child(args.sources)
+        sys.exit(0)
+
+    result = profile(args.sources)
+    text = report(result, args.top, args.budget)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    sys.stdout.write(text)
+
+    if args.budget and result["startup"] > args.budget:
+        print(
+            "startup {:.1f} ms is over the budget of {:.1f} ms".format(
+                result["startup"] * 1000, args.budget * 1000
+            ),
+            file=sys.stderr,
+        )
+        sys.exit(1)
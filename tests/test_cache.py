@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# TTLCache (cache.py) with a stubbed clock.
+#
+#   python -m unittest tests.test_cache
+
+import time
+import threading
+import unittest
+from unittest import mock
+
+from cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        p = mock.patch("time.monotonic", self.clock)
+        p.start()
+        self.addCleanup(p.stop)
+        self.cache = TTLCache("test", 60, maxsize=3)
+        self.computes = 0
+
+    def compute(self, value="value"):
+        self.computes += 1
+        return value
+
+    def test_get_or_set_computes_once(self):
+        self.assertEqual("value", self.cache.get_or_set("k", self.compute))
+        self.assertEqual("value", self.cache.get_or_set("k", self.compute))
+        self.assertEqual(1, self.computes)
+
+    def test_expiry(self):
+        self.cache.get_or_set("k", self.compute)
+        self.clock.now += 59
+        self.assertEqual("value", self.cache.get("k"))
+        self.clock.now += 1
+        self.assertIsNone(self.cache.get("k"))
+        self.cache.get_or_set("k", self.compute)
+        self.assertEqual(2, self.computes)
+
+    def test_ttl_per_entry(self):
+        self.cache.get_or_set("k", self.compute, ttl=5)
+        self.clock.now += 5
+        self.assertEqual("default", self.cache.get("k", "default"))
+
+    def test_none_not_cached(self):
+        self.assertIsNone(self.cache.get_or_set("k", lambda: self.compute(None)))
+        self.assertIsNone(self.cache.get_or_set("k", lambda: self.compute(None)))
+        self.assertEqual(2, self.computes)
+
+    def test_failed_compute_not_cached(self):
+        def fail():
+            raise IOError("upstream down")
+
+        with self.assertRaises(IOError):
+            self.cache.get_or_set("k", fail)
+        self.assertEqual("value", self.cache.get_or_set("k", self.compute))
+
+    def test_concurrent_misses_compute_once(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return self.compute()
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(self.cache.get_or_set("k", slow))
+            )
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        started.wait(5)
+        # give the others time to queue up behind the first
+        time.sleep(0.05)
+        release.set()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(["value"] * 8, results)
+        self.assertEqual(1, self.computes)
+
+    def test_other_keys_not_held_up(self):
+        release = threading.Event()
+        thread = threading.Thread(
+            target=self.cache.get_or_set, args=("slow", lambda: release.wait(5))
+        )
+        thread.start()
+        try:
+            self.assertEqual("value", self.cache.get_or_set("k", self.compute))
+        finally:
+            release.set()
+            thread.join(5)
+
+    def test_evicts_entry_closest_to_expiring(self):
+        self.cache.set("a", 1, ttl=30)
+        self.cache.set("b", 2, ttl=10)
+        self.cache.set("c", 3, ttl=20)
+        self.cache.set("d", 4)
+        self.assertIsNone(self.cache.get("b"))
+        for (key, value) in (("a", 1), ("c", 3), ("d", 4)):
+            self.assertEqual(value, self.cache.get(key))
+
+    def test_replacing_a_key_evicts_nothing(self):
+        for key in "abc":
+            self.cache.set(key, key)
+        self.cache.set("a", "again")
+        self.assertEqual(["again", "b", "c"], [self.cache.get(k) for k in "abc"])
+
+
+if __name__ == "__main__":
+    unittest.main()
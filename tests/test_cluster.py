@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Headline clustering on pages in the replay format (see replay.py).
+#
+#   python -m unittest discover -s tests -t .
+#
+# tests/fixtures holds a small hand-made set: the same stories in two outlets
+# under different URLs and reworded headlines. Pages recorded with
+# "python replay.py record" (NEWSSUM_FIXTURES_DIR) are clustered as well when
+# there are any.
+
+import os
+import unittest
+import threading
+
+import replay
+import pipeline
+from util import get_sources
+from cluster import HeadlineClusterer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "fixtures")
+
+
+def refresh_all(directory):
+    # {source id: articles} of every source with fixtures in directory
+    replay.configure("replay", directory)
+    try:
+        allSources = get_sources()
+        return {
+            id: pipeline.refresh(allSources[id])
+            for id in replay.sources()
+            if id in allSources
+        }
+    finally:
+        replay.configure(None)
+
+
+class ClusterFixturesTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.articles = refresh_all(FIXTURES)
+
+    def clusters(self):
+        clusterer = HeadlineClusterer()
+        for (id, articles) in self.articles.items():
+            clusterer.update(id, articles)
+        return clusterer.clusters()
+
+    def test_fixtures_replayed(self):
+        for id in ("mingpaohk", "stheadline"):
+            self.assertEqual(4, sum(1 for a in self.articles[id] if a.get("url")), id)
+
+    def test_syndicated_stories_grouped(self):
+        groups = [
+            sorted(article["url"].rsplit("/", 1)[-1] for (_, article) in group)
+            for group in self.clusters()
+        ]
+        # stories 1 to 3 are in both outlets, story 4 is a different one
+        self.assertEqual([["1", "1"], ["2", "2"], ["3", "3"]], sorted(groups))
+
+    def test_groups_span_sources(self):
+        for group in self.clusters():
+            self.assertEqual({"mingpaohk", "stheadline"}, {id for (id, _) in group})
+
+    def test_concurrent_updates(self):
+        # sources refreshed together (e.g. /combined) update at the same time
+        clusterer = HeadlineClusterer()
+        threads = [
+            threading.Thread(target=clusterer.update, args=(id, articles))
+            for _ in range(20)
+            for (id, articles) in self.articles.items()
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(3, len(clusterer.clusters()))
+
+
+class ClusterRecordedTest(unittest.TestCase):
+    def test_recorded_fixtures(self):
+        if not os.path.isdir(replay.FIXTURES_DIR):
+            self.skipTest("no recorded fixtures in " + replay.FIXTURES_DIR)
+        articles = refresh_all(replay.FIXTURES_DIR)
+        clusterer = HeadlineClusterer()
+        for (id, source_articles) in articles.items():
+            clusterer.update(id, source_articles)
+        for group in clusterer.clusters():
+            # only stories carried by several outlets, each article once
+            self.assertGreater(len({id for (id, _) in group}), 1)
+            urls = [article["url"] for (_, article) in group]
+            self.assertEqual(len(urls), len(set(urls)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Edition dates (sources/edition.py) with the home page and clock stubbed.
+#
+#   python -m unittest tests.test_edition
+
+import threading
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import pytz
+
+from sources import edition
+from sources.edition import EditionDate
+
+TIMEZONE = pytz.timezone("Hongkong")
+
+
+def timestamp(*args):
+    return TIMEZONE.localize(datetime(*args)).timestamp()
+
+
+class HomePage:
+    # stands in for read_html_page; the "page" is the date it links to
+    def __init__(self, date):
+        self.date = date
+        self.fetches = 0
+        self.failing = False
+        # cleared to hold fetches until set
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        with self._lock:
+            self.fetches += 1
+        self.release.wait(5)
+        if self.failing:
+            raise IOError("upstream down")
+        return self.date
+
+
+def wait_for_refresh():
+    for t in threading.enumerate():
+        if t.name == "edition-date":
+            t.join(5)
+
+
+class EditionDateTest(unittest.TestCase):
+    def setUp(self):
+        # 10am on the 10th, the edition of the 10th is out since 4am
+        self.now = timestamp(2024, 3, 10, 10, 0)
+        self.page = HomePage("20240310")
+        patches = [
+            mock.patch.object(edition, "read_html_page", self.page),
+            mock.patch("time.time", lambda: self.now),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.edition = EditionDate("http://paper/", lambda date: date, "Hongkong")
+        self.edition._local_now = lambda: datetime.fromtimestamp(self.now, TIMEZONE)
+
+    def test_first_get_fetches(self):
+        self.assertEqual("20240310", self.edition.get())
+        self.assertEqual(1, self.page.fetches)
+
+    def test_kept_until_rollover(self):
+        self.edition.get()
+        self.now = timestamp(2024, 3, 11, 3, 59)
+        self.assertEqual("20240310", self.edition.get())
+        self.assertEqual(1, self.page.fetches)
+
+    def test_resolved_at_rollover(self):
+        self.edition.get()
+        self.page.date = "20240311"
+        self.now = timestamp(2024, 3, 11, 4, 0)
+        # not the previous edition while the new one is looked up
+        self.assertEqual("20240311", self.edition.get())
+        self.assertEqual(2, self.page.fetches)
+
+    def test_concurrent_first_gets_share_a_fetch(self):
+        self.page.release.clear()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.edition.get()))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        self.page.release.set()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(["20240310"] * 8, results)
+        self.assertEqual(1, self.page.fetches)
+
+    def test_retried_in_background_until_out(self):
+        # just past the rollover, the home page still links the old edition
+        self.now = timestamp(2024, 3, 11, 4, 5)
+        self.page.date = "20240310"
+        self.assertEqual("20240310", self.edition.get())
+
+        # asked again after RETRY_INTERVAL, without waiting for it
+        self.page.date = "20240311"
+        self.now += edition.RETRY_INTERVAL
+        self.assertEqual("20240310", self.edition.get())
+        wait_for_refresh()
+        self.assertEqual(2, self.page.fetches)
+        self.assertEqual("20240311", self.edition.get())
+
+    def test_failed_retry_tried_again(self):
+        self.now = timestamp(2024, 3, 11, 4, 5)
+        self.page.date = "20240310"
+        self.edition.get()
+
+        self.page.failing = True
+        self.now += edition.RETRY_INTERVAL
+        self.edition.get()
+        wait_for_refresh()
+        # the failure neither sticks nor blocks the next retry
+        self.page.failing = False
+        self.page.date = "20240311"
+        self.now += edition.RETRY_INTERVAL
+        self.edition.get()
+        wait_for_refresh()
+        self.assertEqual(3, self.page.fetches)
+        self.assertEqual("20240311", self.edition.get())
+
+    def test_system_date_when_none_found(self):
+        self.page.date = None
+        self.assertEqual("20240310", self.edition.get())
+
+
+if __name__ == "__main__":
+    unittest.main()
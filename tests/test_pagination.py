@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Incremental pagination (sources/pagination.py) on stubbed pages and clock.
+#
+#   python -m unittest tests.test_pagination
+
+import unittest
+from unittest import mock
+
+from cache import TTLCache
+from sources import pagination
+from sources.pagination import paginate
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Section:
+    # a section listing: page n holds the urls of pages[n - 1]
+    def __init__(self, *pages):
+        self.pages = [list(p) for p in pages]
+        self.fetched = []
+        self.failing = False
+
+    def fetch(self, n):
+        self.fetched.append(n)
+        if self.failing or n > len(self.pages):
+            return None
+        return self.pages[n - 1]
+
+    def extract(self, page):
+        return [{"title": url, "url": url} for url in page]
+
+
+def urls(articles):
+    return [a["url"] for a in articles]
+
+
+class PaginateTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patches = [
+            mock.patch.object(pagination, "_snapshots", TTLCache("test", 3600)),
+            mock.patch("time.monotonic", self.clock),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.section = Section(["a1", "a2"], ["a3", "a4"], ["a5", "a6"])
+
+    def paginate(self, **kwargs):
+        self.section.fetched = []
+        return urls(
+            paginate(self.section.fetch, self.section.extract, 3, key="s", **kwargs)
+        )
+
+    def test_first_refresh_fetches_every_page(self):
+        self.assertEqual(["a1", "a2", "a3", "a4", "a5", "a6"], self.paginate())
+        self.assertEqual([1, 2, 3], sorted(self.section.fetched))
+
+    def test_page_count(self):
+        result = self.paginate(page_count=lambda page: 2)
+        self.assertEqual(["a1", "a2", "a3", "a4"], result)
+        self.assertEqual([1, 2], sorted(self.section.fetched))
+
+    def test_nothing_new_costs_one_page(self):
+        first = self.paginate()
+        self.assertEqual(first, self.paginate())
+        self.assertEqual([1], self.section.fetched)
+
+    def test_stops_at_first_page_without_new_articles(self):
+        self.paginate()
+        self.section.pages = [["n1", "a1"], ["a2", "a3"], ["a4", "a5"]]
+        result = self.paginate()
+        self.assertEqual([1, 2], self.section.fetched)
+        # filled in from the last refresh, up to its length
+        self.assertEqual(["n1", "a1", "a2", "a3", "a4", "a5"], result)
+
+    def test_filled_in_without_duplicates(self):
+        self.paginate()
+        self.section.pages = [["n1", "n2"], ["a1", "a2"], ["a3", "a4"]]
+        self.assertEqual(["n1", "n2", "a1", "a2", "a3", "a4"], self.paginate())
+
+    def test_upstream_failure_keeps_last_list(self):
+        first = self.paginate()
+        self.section.failing = True
+        self.assertEqual(first, self.paginate())
+
+    def test_snapshot_expires(self):
+        self.paginate()
+        self.clock.now += pagination.SNAPSHOT_MAX_AGE
+        self.paginate()
+        self.assertEqual([1, 2, 3], sorted(self.section.fetched))
+
+    def test_snapshot_not_changed_by_callers(self):
+        articles = paginate(self.section.fetch, self.section.extract, 3, key="s")
+        articles[0]["title"] = "edited"
+        again = paginate(self.section.fetch, self.section.extract, 3, key="s")
+        self.assertEqual("a1", again[0]["title"])
+
+    def test_without_key_every_page_every_time(self):
+        for _ in range(2):
+            self.section.fetched = []
+            paginate(self.section.fetch, self.section.extract, 3)
+            self.assertEqual([1, 2, 3], sorted(self.section.fetched))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# The sampling profiler (profiler.py) only samples the request it profiles.
+#
+#   python -m unittest tests.test_profiler
+
+import time
+import threading
+import unittest
+
+import profiler
+from context import run_concurrently
+
+
+def profiled_work(item):
+    deadline = time.perf_counter() + 0.1
+    while time.perf_counter() < deadline:
+        pass
+    return item
+
+
+def functions(collapsed):
+    # names of the functions in the collapsed stacks
+    return {
+        frame.split(" (")[0]
+        for line in collapsed.splitlines()
+        for frame in line.rsplit(" ", 1)[0].split(";")
+    }
+
+
+def other_request(stop):
+    while not stop.is_set():
+        pass
+
+
+class SamplerTest(unittest.TestCase):
+    def sample(self, work):
+        # work runs under a sampler while another "request" keeps busy
+        stop = threading.Event()
+        other = threading.Thread(target=other_request, args=(stop,))
+        other.start()
+        try:
+            with profiler.Sampler(interval=0.001) as sampler:
+                work()
+        finally:
+            stop.set()
+            other.join()
+        return sampler.collapsed()
+
+    def test_own_thread_only(self):
+        names = functions(self.sample(lambda: profiled_work(1)))
+        self.assertIn("profiled_work", names)
+        self.assertNotIn("other_request", names)
+
+    def test_worker_threads_sampled(self):
+        collapsed = self.sample(lambda: run_concurrently(profiled_work, [1, 2]))
+        # the work only runs in the pool's threads
+        workers = [s for s in collapsed.splitlines() if "profiled_work" in s]
+        self.assertTrue(workers)
+        self.assertTrue(all("_run_in_worker" in s for s in workers))
+        self.assertNotIn("other_request", functions(collapsed))
+
+    def test_overlapping_samplers_apart(self):
+        results = {}
+
+        def request(name, work):
+            with profiler.Sampler(interval=0.001) as sampler:
+                work(1)
+            results[name] = functions(sampler.collapsed())
+
+        def other_work(item):
+            return profiled_work(item)
+
+        threads = [
+            threading.Thread(target=request, args=("a", profiled_work)),
+            threading.Thread(target=request, args=("b", other_work)),
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertNotIn("other_work", results["a"])
+        self.assertIn("other_work", results["b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
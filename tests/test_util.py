@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# The source manifest (sources/manifest.json) and the registry built from it.
+#
+#   python -m unittest tests.test_util
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import util
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "manifest.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, manifest):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+    def test_manifest_up_to_date(self):
+        # "make manifest" after changing a module under sources/
+        util.write_manifest(self.path)
+        with open(self.path, encoding="utf-8") as f:
+            current = json.load(f)
+        with open(util.MANIFEST, encoding="utf-8") as f:
+            self.assertEqual(current, json.load(f))
+
+    def test_changed_module_scanned(self):
+        util.write_manifest(self.path)
+        with open(self.path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        # hk changed since: its entries are not trusted
+        manifest["modules"]["hk"] = "0" * 40
+        for entry in manifest["sources"]:
+            if entry["module"] == "sources.hk":
+                entry["desc"] = "stale"
+        self.write(manifest)
+
+        with mock.patch.object(util, "MANIFEST", self.path):
+            sources = util.get_sources()
+        self.assertEqual("明報(香港)", sources.get_desc("mingpaohk"))
+        self.assertIsNotNone(sources._instances.get("mingpaohk"))
+        # the modules unchanged are still only imported on first access
+        self.assertNotIn("cbcnews", sources._instances)
+        self.assertIn("cbcnews", sources)
+
+    def test_missing_class_unknown(self):
+        entry = {
+            "id": "gone",
+            "desc": "Gone",
+            "module": "sources.hk",
+            "class": "Gone",
+            "family": None,
+        }
+        sources = util.SourceRegistry([entry])
+        self.assertIn("gone", sources)
+        self.assertIsNone(sources.get("gone"))
+        with self.assertRaises(KeyError):
+            sources["gone"]
+        self.assertNotIn("gone", sources)
+        self.assertEqual([], list(sources))
+
+
+if __name__ == "__main__":
+    unittest.main()
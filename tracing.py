@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Clarence Ho (clarenceho at gmail dot com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Request tracing. A trace is a tree of timed spans (fetch, parse, serialise,
+# ...) started by each request. The current span is kept in a context variable,
+# so work handed to other threads with context.run_concurrently stays in the
+# same trace. Finished traces are written as JSON lines to TRACE_FILE and / or
+# posted to TRACE_COLLECTOR, both from a background thread.
+
+import os
+import json
+import time
+import queue
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import urllib3
+
+# where finished traces go. Neither set: traces are only kept for ?trace=1
+TRACE_FILE = os.environ.get("NEWSSUM_TRACE_FILE")
+TRACE_COLLECTOR = os.environ.get("NEWSSUM_TRACE_COLLECTOR")
+# finished traces waiting to be exported; more than this are dropped
+MAX_QUEUE_SIZE = 1000
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id(bits):
+    return "%0*x" % (bits // 4, random.getrandbits(bits))
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start",
+        "duration",
+        "attributes",
+        "children",
+        "_started",
+    )
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else _new_id(128)
+        self.span_id = _new_id(64)
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time()
+        self.duration = None
+        self.attributes = attributes or {}
+        self.children = []
+        self._started = time.perf_counter()
+        if parent:
+            parent.children.append(self)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def backdate(self, seconds):
+        # the span began earlier than it was opened, e.g. to cover work timed
+        # elsewhere before it
+        self.start -= seconds
+        self._started -= seconds
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    def to_dict(self):
+        # spans still open (e.g. the request itself) report the time so far
+        duration = self.duration
+        if duration is None:
+            duration = time.perf_counter() - self._started
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "start": round(self.start, 6),
+            "duration": round(duration, 6),
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def trace_id():
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+@contextmanager
+def span(name, **attributes):
+    # a child of the current span, or the root of a new trace
+    parent = _current_span.get()
+    s = Span(name, parent, attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    finally:
+        s.finish()
+        _current_span.reset(token)
+        if parent is None:
+            export(s)
+
+
+def add_span(name, duration, **attributes):
+    # record work that has already been timed, e.g. a page parsed chunk by
+    # chunk while downloading. Does nothing outside a trace
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    s = Span(name, parent, attributes)
+    s.start -= duration
+    s.duration = duration
+    return s
+
+
+def begin(name, **attributes):
+    # for a root span that can't be wrapped in a with block, e.g. one opened
+    # and closed by separate request hooks. Returns a handle for end()
+    s = Span(name, _current_span.get(), attributes)
+    return (s, _current_span.set(s))
+
+
+def end(handle):
+    (s, token) = handle
+    s.finish()
+    _current_span.reset(token)
+    if s.parent_id is None:
+        export(s)
+
+
+def _flatten(root):
+    for s in root.walk():
+        yield {
+            "trace_id": s.trace_id,
+            "span_id": s.span_id,
+            "parent_id": s.parent_id,
+            "name": s.name,
+            "start": round(s.start, 6),
+            "duration": round(s.duration or 0, 6),
+            "attributes": s.attributes,
+        }
+
+
+class _Exporter:
+    def __init__(self, path=None, url=None):
+        self.path = path
+        self.url = url
+        self._queue = queue.Queue(MAX_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _run(self):
+        http = urllib3.PoolManager(timeout=5) if self.url else None
+        while True:
+            spans = list(_flatten(self._queue.get()))
+            try:
+                if self.path:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        for s in spans:
+                            f.write(json.dumps(s, ensure_ascii=False) + "\n")
+                if http:
+                    http.request(
+                        "POST",
+                        self.url,
+                        body=json.dumps(spans).encode("utf-8"),
+                        headers={"Content-Type": "application/json"},
+                    )
+            except (Exception, Warning):
+                # tracing must never take the app down with it
+                pass
+
+    def submit(self, root):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="trace-exporter", daemon=True
+                )
+                self._thread.start()
+        try:
+            self._queue.put_nowait(root)
+        except queue.Full:
+            pass
+
+
+_exporter = _Exporter(TRACE_FILE, TRACE_COLLECTOR)
+
+
+def export(root):
+    if _exporter.path or _exporter.url:
+        _exporter.submit(root)
@@ -20,23 +20,178 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
 import sys
+import json
+import hashlib
 import pkgutil
 import inspect
+import importlib
+import threading
 
-from sources.base import BaseSource
+from logger import logger
 
+SOURCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sources")
+MANIFEST = os.path.join(SOURCES_DIR, "manifest.json")
 
-def get_sources():
-    result = {}
 
-    for _, name, _ in pkgutil.iter_modules(["sources"]):
-        __import__("sources." + name)
-        for item in inspect.getmembers(sys.modules["sources." + name], inspect.isclass):
-            cls = item[1]
-            if issubclass(cls, BaseSource) and not inspect.isabstract(cls):
-                obj = cls()
-                if obj.get_id():
-                    result[obj.get_id()] = obj
+def _scan_module(name):
+    from sources.base import BaseSource
 
+    module = importlib.import_module("sources." + name)
+    result = []
+    for (_, cls) in inspect.getmembers(module, inspect.isclass):
+        # only classes defined here; imported base classes belong to their own module
+        if (
+            cls.__module__ == module.__name__
+            and issubclass(cls, BaseSource)
+            and not inspect.isabstract(cls)
+        ):
+            obj = cls()
+            if obj.get_id():
+                result.append(obj)
     return result
+
+
+def _source_modules():
+    return [name for (_, name, _) in pkgutil.iter_modules([SOURCES_DIR])]
+
+
+def _module_digest(name):
+    # of the module's source, to tell whether it changed since the manifest
+    # was written. Not the mtime, which a git checkout sets in path order
+    try:
+        with open(os.path.join(SOURCES_DIR, name + ".py"), "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def discover_sources():
+    # import every module under sources/ and instantiate the sources found
+    result = {}
+    for name in _source_modules():
+        for obj in _scan_module(name):
+            result[obj.get_id()] = obj
+    return result
+
+
+def write_manifest(path=MANIFEST):
+    # record id, description and location of every source so that they can
+    # be listed without importing any scraper. Run "make manifest" after
+    # changing a module under sources/
+    modules = dict((name, _module_digest(name)) for name in _source_modules())
+    entries = []
+    for name in modules:
+        for obj in _scan_module(name):
+            entries.append(
+                {
+                    "id": obj.get_id(),
+                    "desc": obj.get_desc(),
+                    "module": "sources." + name,
+                    "class": type(obj).__name__,
+                    "family": obj.get_family(),
+                }
+            )
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"modules": modules, "sources": entries}, f, ensure_ascii=False, indent=2
+        )
+        f.write("\n")
+    return entries
+
+
+class SourceRegistry:
+    # mapping of source id -> source object. Sources listed in the manifest
+    # are only imported and instantiated on first access
+    def __init__(self, entries, instances=None):
+        self._lock = threading.Lock()
+        self._entries = dict((e["id"], e) for e in entries)
+        self._instances = dict(instances or {})
+
+    def get_desc(self, id):
+        if id in self._instances:
+            return self._instances[id].get_desc()
+        return self._entries[id]["desc"]
+
+    def get_family(self, id):
+        if id in self._instances:
+            return self._instances[id].get_family()
+        return self._entries[id].get("family")
+
+    def family(self, name):
+        # ids of the editions in the family
+        return [id for id in self if self.get_family(id) == name]
+
+    def __getitem__(self, id):
+        obj = self._instances.get(id)
+        if obj is None:
+            entry = self._entries[id]
+            with self._lock:
+                obj = self._instances.get(id)
+                if obj is None:
+                    module = importlib.import_module(entry["module"])
+                    cls = getattr(module, entry["class"], None)
+                    if cls is None:
+                        # removed or renamed since the manifest was written
+                        self._entries.pop(id, None)
+                        raise KeyError(id)
+                    obj = cls()
+                    self._instances[id] = obj
+        return obj
+
+    def get(self, id):
+        # the source, or None if there is no such source
+        try:
+            return self[id]
+        except KeyError:
+            return None
+
+    def __contains__(self, id):
+        return id in self._entries or id in self._instances
+
+    def __iter__(self):
+        return iter(
+            list(self._entries) + [i for i in self._instances if i not in self._entries]
+        )
+
+    def __len__(self):
+        return len(set(self._entries) | set(self._instances))
+
+
+def get_sources():
+    try:
+        with open(MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        # no manifest, discover everything up front
+        return SourceRegistry([], discover_sources())
+
+    # modules added or changed since the manifest was written are scanned
+    # right away, and what the manifest says about them is dropped
+    known = manifest["modules"]
+    stale = [
+        name for name in _source_modules() if known.get(name) != _module_digest(name)
+    ]
+    if stale:
+        logger.warning(
+            "manifest.json is out of date for "
+            + ", ".join(stale)
+            + ", run make manifest"
+        )
+    instances = {}
+    for name in stale:
+        for obj in _scan_module(name):
+            instances[obj.get_id()] = obj
+    stale_modules = ["sources." + name for name in stale]
+    entries = [e for e in manifest["sources"] if e["module"] not in stale_modules]
+
+    return SourceRegistry(entries, instances)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["manifest"]:
+        print("{} sources written to {}".format(len(write_manifest()), MANIFEST))
+    else:
+        print("usage: python util.py manifest")